@@ -40,79 +40,7 @@ import os
 
 _ = gettext.gettext
 
-SUPPORTED_FORMATS = [
-    # Found in /usr/share/mime
-    "audio/ac3",
-    "audio/AMR",
-    "audio/AMR-WB",
-    "audio/annodex",
-    "audio/basic",
-    "audio/midi",
-    "audio/mp2",
-    "audio/mp4",
-    "audio/mpeg",
-    "audio/ogg",
-    "audio/prs.sid",
-    "audio/vnd.rn-realaudio",
-    "audio/x-adpcm",
-    "audio/x-aifc",
-    "audio/x-aiff",
-    "audio/x-aiffc",
-    "audio/x-ape",
-    "audio/x-flac",
-    "audio/x-flac+ogg",
-    "audio/x-gsm",
-    "audio/x-it",
-    "audio/x-m4b",
-    "audio/x-matroska",
-    "audio/x-minipsf",
-    "audio/x-mod",
-    "audio/x-mpegurl",
-    "audio/x-ms-asx",
-    "audio/x-ms-wma",
-    "audio/x-musepack",
-    "audio/x-psf",
-    "audio/x-psflib",
-    "audio/x-riff",
-    "audio/x-s3m",
-    "audio/x-scpls",
-    "audio/x-speex",
-    "audio/x-speex+ogg",
-    "audio/x-stm",
-    "audio/x-tta",
-    "audio/x-voc",
-    "audio/x-vorbis+ogg",
-    "audio/x-wav",
-    "audio/x-wavpack",
-    "audio/x-wavpack-correction",
-    "audio/x-xi",
-    "audio/x-xm",
-    "audio/x-xmf",
-    "video/3gpp",
-    "video/annodex",
-    "video/dv",
-    "video/isivideo",
-    "video/mp2t",
-    "video/mp4",
-    "video/mpeg",
-    "video/ogg",
-    "video/quicktime",
-    "video/vivo",
-    "video/vnd.rn-realvideo",
-    "video/wavelet",
-    "video/x-anim",
-    "video/x-flic",
-    "video/x-flv",
-    "video/x-matroska",
-    "video/x-mng",
-    "video/x-ms-asf",
-    "video/x-msvideo",
-    "video/x-ms-wmv",
-    "video/x-nsv",
-    "video/x-ogm+ogg",
-    "video/x-sgi-movie",
-    "video/x-theora+ogg",
-]
+SUPPORTED_FORMATS = arista.utils.SUPPORTED_FORMATS
 
 class MediaConvertExtension(nautilus.MenuProvider):
     """
@@ -146,8 +74,7 @@ class MediaConvertExtension(nautilus.MenuProvider):
         devices = nautilus.Menu()
         menu.set_submenu(devices)
         
-        presets = arista.presets.get().items()
-        for shortname, device in sorted(presets, lambda x,y: cmp(x[1].name, y[1].name)):
+        for shortname, device in arista.registry.get().sorted_devices():
             item = nautilus.MenuItem("Nautilus::convert_to_%s" % shortname,
                                      device.name,
                                      device.description)
@@ -36,21 +36,59 @@
 """
 
 import gettext
+import sys
 
 _ = gettext.gettext
 
+# Modules that need GStreamer, GObject or device discovery. These are only
+# imported when first used so that commands that just deal with presets
+# start quickly.
+LAZY_MODULES = ["benchmark", "discoverer", "dvd", "inputs", "queue",
+                "thumbnailer", "transcoder"]
+
+class _LazyModule(object):
+    """
+        A placeholder for a submodule that imports the real module on first
+        attribute access and then replaces itself with it.
+    """
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+    
+    def _load(self):
+        name = object.__getattribute__(self, "_name")
+        fullname = __name__ + "." + name
+        __import__(fullname)
+        module = sys.modules[fullname]
+        setattr(sys.modules[__name__], name, module)
+        return module
+    
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+    
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+    
+    def __repr__(self):
+        return "<lazy module '%s.%s'>" % (__name__,
+                                          object.__getattribute__(self, "_name"))
+
 def init():
     """
         Initialize the arista module. You MUST call this method after
-        importing.
+        importing. Modules in LAZY_MODULES are imported the first time they
+        are used.
     """
-    import discoverer
-    import dvd
-    import inputs
+    import history
+    import infocache
     import presets
-    import queue
-    import transcoder
+    import recommender
+    import registry
     import utils
+    
+    module = sys.modules[__name__]
+    for name in LAZY_MODULES:
+        if not isinstance(getattr(module, name, None), type(sys)):
+            setattr(module, name, _LazyModule(name))
 
 __version__ = _("0.9.8")
 __author__ = _("Daniel G. Taylor <dan@programmer-art.org>")
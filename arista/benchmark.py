@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+"""
+    Arista Encode Benchmark
+    =======================
+    Measure how fast presets encode on this machine by running synthetic
+    test sources through the real transcoder.
+
+    Example Use
+    -----------
+    Generate the sources once, then benchmark any number of presets:
+
+        >>> sources = arista.benchmark.generate_sources("/tmp/bench")
+        >>> result = arista.benchmark.run(preset, sources[0], "/tmp/out")
+        >>> result["realtime"]
+        4.2
+
+    License
+    -------
+    Copyright 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import gettext
+import logging
+import os
+import platform
+import resource
+import time
+
+import gobject
+import gst
+
+import transcoder
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.benchmark")
+
+# The synthetic sources as (width, height, seconds)
+SOURCES = [
+    (320, 240, 30),
+    (640, 480, 20),
+    (1280, 720, 10),
+    (1920, 1080, 5),
+]
+
+SOURCE_FRAMERATE = 25
+SOURCE_RATE = 44100
+
+# Samples per buffer of audiotestsrc
+SOURCE_SAMPLES = 1024
+
+# An encode is stopped as failed after this many times the source duration,
+# but never before RUN_TIMEOUT_MIN seconds, in case the pipeline stalls
+# without posting an error
+RUN_TIMEOUT_FACTOR = 20
+RUN_TIMEOUT_MIN = 60
+
+class BenchmarkException(Exception):
+    """
+        An exception to be thrown when a benchmark cannot be run.
+    """
+    pass
+
+def _reset_peak_rss():
+    """
+        Reset the peak resident memory of this process so the next reading
+        only covers what happens from now on. This needs Linux 4.0 or newer.
+
+        @rtype: bool
+        @return: Whether the peak was reset
+    """
+    try:
+        open("/proc/self/clear_refs", "w").write("5")
+    except (IOError, OSError):
+        return False
+
+    return _get_peak_rss() is not None
+
+def _get_peak_rss():
+    """
+        @rtype: int
+        @return: The peak resident memory of this process since the last
+                 reset in bytes or None if unknown
+    """
+    try:
+        for line in open("/proc/self/status"):
+            if line.startswith("VmHWM:"):
+                # The value is in kilobytes
+                return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+class Source(object):
+    """
+        A generated test file.
+    """
+    def __init__(self, filename, width, height, seconds):
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.seconds = seconds
+
+    @property
+    def name(self):
+        return "%dx%d" % (self.width, self.height)
+
+def _run_pipeline(pipe):
+    """
+        Play a pipeline until it is done.
+
+        @type pipe: gst.Pipeline
+        @param pipe: The pipeline to run
+        @raise BenchmarkException: The pipeline posted an error
+    """
+    loop = gobject.MainLoop()
+    errors = []
+
+    def _on_message(bus, message):
+        if message.type == gst.MESSAGE_EOS:
+            loop.quit()
+        elif message.type == gst.MESSAGE_ERROR:
+            errors.append(str(message.parse_error()[0]))
+            loop.quit()
+
+    bus = pipe.get_bus()
+    bus.add_signal_watch()
+    handler = bus.connect("message", _on_message)
+
+    pipe.set_state(gst.STATE_PLAYING)
+    try:
+        loop.run()
+    finally:
+        pipe.set_state(gst.STATE_NULL)
+        bus.disconnect(handler)
+        bus.remove_signal_watch()
+
+    if errors:
+        raise BenchmarkException(errors[0])
+
+def generate_source(filename, width, height, seconds):
+    """
+        Write a test file with moving video and noise audio. The video is
+        stored as Motion JPEG and the audio uncompressed so that decoding
+        the source takes little time compared to encoding.
+
+        @type filename: str
+        @param filename: The file to write
+        @type width: int
+        @param width: The video width
+        @type height: int
+        @param height: The video height
+        @type seconds: int
+        @param seconds: The duration
+        @rtype: Source
+        @return: The generated source
+        @raise BenchmarkException: The source could not be written
+    """
+    cmd = "videotestsrc pattern=ball num-buffers=%(frames)d ! " \
+          "video/x-raw-yuv,width=%(width)d,height=%(height)d," \
+          "framerate=%(framerate)d/1 ! jpegenc ! queue ! " \
+          "matroskamux name=mux ! filesink location=\"%(filename)s\" " \
+          "audiotestsrc wave=pink-noise num-buffers=%(buffers)d " \
+          "samplesperbuffer=%(samples)d ! " \
+          "audio/x-raw-int,rate=%(rate)d,channels=2 ! queue ! mux." % {
+        "frames": seconds * SOURCE_FRAMERATE,
+        "width": width,
+        "height": height,
+        "framerate": SOURCE_FRAMERATE,
+        "filename": filename,
+        "buffers": (seconds * SOURCE_RATE + SOURCE_SAMPLES - 1) / \
+                   SOURCE_SAMPLES,
+        "samples": SOURCE_SAMPLES,
+        "rate": SOURCE_RATE,
+    }
+
+    try:
+        pipe = gst.parse_launch(cmd)
+    except gobject.GError, e:
+        raise BenchmarkException(_("Unable to construct pipeline! ") + \
+                                 str(e))
+
+    _run_pipeline(pipe)
+
+    return Source(filename, width, height, seconds)
+
+def generate_sources(directory, sources=SOURCES):
+    """
+        Write all test files into a directory.
+
+        @type directory: str
+        @param directory: The directory to write the files to
+        @type sources: list
+        @param sources: The (width, height, seconds) of each file
+        @rtype: list
+        @return: The generated Source objects in the same order
+    """
+    generated = []
+    for width, height, seconds in sources:
+        filename = os.path.join(directory, "source-%dx%d-%ds.mkv" % \
+                                           (width, height, seconds))
+        _log.debug(_("Generating %(filename)s") % {
+            "filename": filename,
+        })
+        generated.append(generate_source(filename, width, height, seconds))
+
+    return generated
+
+def run(preset, source, directory):
+    """
+        Encode a source with a preset and measure it. The encode is not
+        recorded in the encode history as generated test media says little
+        about real encodes. Encodes that take too long are stopped and
+        reported with an error, see RUN_TIMEOUT_FACTOR.
+
+        @type preset: arista.presets.Preset
+        @param preset: The preset to benchmark
+        @type source: Source
+        @param source: The generated source to encode
+        @type directory: str
+        @param directory: Where to write the output, which is removed
+                          afterward
+        @rtype: dict
+        @return: The device and preset names, source name and duration,
+                 "wall" and "cpu" seconds, "realtime" factor (seconds of
+                 input encoded per wall second), "peak_rss" of the process
+                 during this run in bytes or None if it can't be measured
+                 per run, output "size" in bytes and "bitrate" in bits per
+                 second, and the "error" string if the encode failed
+        @raise BenchmarkException: Nothing could be measured
+    """
+    output = os.path.join(directory, "output-%s.%s" % (source.name,
+                                                      preset.extension))
+    uri = "file://" + os.path.abspath(source.filename)
+    options = transcoder.TranscoderOptions(uri, preset, output)
+
+    loop = gobject.MainLoop()
+    errors = []
+
+    def _on_error(enc, errorstr):
+        errors.append(errorstr)
+        loop.quit()
+
+    def _on_discovered(enc, info, is_media):
+        if not is_media:
+            _on_error(enc, _("Not a recognized media file!"))
+
+    measure_rss = _reset_peak_rss()
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+
+    enc = transcoder.Transcoder(options, record_history=False)
+    enc.connect("discovered", _on_discovered)
+    enc.connect("complete", lambda enc: loop.quit())
+    enc.connect("error", _on_error)
+    
+    limit = max(source.seconds * RUN_TIMEOUT_FACTOR, RUN_TIMEOUT_MIN)
+    timed_out = []
+    
+    def _on_timeout():
+        timed_out.append(True)
+        _on_error(enc, _("Timed out after %(seconds)d seconds!") % {
+            "seconds": limit,
+        })
+        return False
+    
+    timeout = gobject.timeout_add(limit * 1000, _on_timeout)
+    loop.run()
+    if not timed_out:
+        gobject.source_remove(timeout)
+    enc.stop()
+
+    wall = time.time() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    peak_rss = measure_rss and _get_peak_rss() or None
+
+    if wall <= 0:
+        raise BenchmarkException(_("No time passed!"))
+
+    size = 0
+    if os.path.exists(output):
+        size = os.path.getsize(output)
+        os.unlink(output)
+
+    return {
+        "device": preset.device.name,
+        "preset": preset.name,
+        "source": source.name,
+        "duration": source.seconds,
+        "wall": round(wall, 3),
+        "cpu": round(usage.ru_utime + usage.ru_stime - \
+                     start_usage.ru_utime - start_usage.ru_stime, 3),
+        "realtime": round(source.seconds / wall, 3),
+        "peak_rss": peak_rss,
+        "size": size,
+        "bitrate": int(size * 8 / source.seconds),
+        "error": errors and errors[0] or None,
+    }
+
+def get_system_info():
+    """
+        @rtype: dict
+        @return: Information about this machine and software versions to
+                 compare benchmark runs by
+    """
+    import arista
+
+    return {
+        "arista": arista.__version__,
+        "gstreamer": ".".join([str(x) for x in gst.version()]),
+        "python": platform.python_version(),
+        "system": platform.system(),
+        "release": platform.release(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "host": platform.node(),
+        "cpus": transcoder.CPU_COUNT,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
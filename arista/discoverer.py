@@ -31,6 +31,7 @@ Modified to use uridecodebin instead of decodebin
 
 import gettext
 import logging
+import time
 
 import os.path
 
@@ -40,9 +41,106 @@ import gst
 
 from gst.extend.pygobject import gsignal
 
+import infocache
+
 _ = gettext.gettext
 _log = logging.getLogger("arista.discoverer")
 
+# Containers that describe their streams in the headers, so a fast probe
+# without decoding is usually enough for files with these extensions
+FAST_PROBE_EXTENSIONS = ["avi", "m4a", "m4v", "mkv", "mov", "mp4", "mpeg",
+                         "mpg", "oga", "ogg", "ogv", "vob", "webm"]
+
+# Give up when discovery has made no progress for this many seconds
+DISCOVER_TIMEOUT = 3.0
+
+# Never spend longer than this many seconds discovering a single file
+DISCOVER_MAX_TIMEOUT = 30.0
+
+class MediaInfo(object):
+    """
+    A small value object holding the discovered information about a file,
+    independent of the discovery pipeline. It can be pickled and converted
+    to and from a dict of plain values for JSON.
+
+    Caps and the video framerate are stored as plain values and converted
+    to gst.Caps and gst.Fraction when accessed.
+    """
+    __slots__ = ["filename", "mimetype", "_audiocaps", "_videocaps",
+                 "videowidth", "videoheight", "_videorate", "audiofloat",
+                 "audiorate", "audiodepth", "audiowidth", "audiochannels",
+                 "audiolength", "videolength", "is_video", "is_audio",
+                 "otherstreams", "tags"]
+
+    def __init__(self, filename=None, **fields):
+        self.filename = filename
+        self.mimetype = None
+        self._audiocaps = None
+        self._videocaps = None
+        self.videowidth = 0
+        self.videoheight = 0
+        self._videorate = (0, 1)
+        self.audiofloat = False
+        self.audiorate = 0
+        self.audiodepth = 0
+        self.audiowidth = 0
+        self.audiochannels = 0
+        self.audiolength = 0L
+        self.videolength = 0L
+        self.is_video = False
+        self.is_audio = False
+        self.otherstreams = []
+        self.tags = {}
+
+        for key, value in fields.items():
+            if key in ["audiocaps", "videocaps", "videorate"]:
+                key = "_" + key
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return "MediaInfo(%r)" % self.filename
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def audiocaps(self):
+        return self._audiocaps and gst.Caps(self._audiocaps) or {}
+
+    @property
+    def videocaps(self):
+        return self._videocaps and gst.Caps(self._videocaps) or {}
+
+    @property
+    def videorate(self):
+        return gst.Fraction(*self._videorate)
+
+    @property
+    def length(self):
+        return max(self.videolength, self.audiolength)
+
+    def as_dict(self):
+        """
+        Get the information as a dict of plain values, e.g. for JSON.
+        """
+        data = {"filename": self.filename}
+        for key in self.__slots__:
+            if key != "filename":
+                data[key.lstrip("_")] = getattr(self, key)
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Create a new MediaInfo from a dict as returned by as_dict.
+        """
+        data = dict([(str(key), value) for key, value in data.items()])
+        data["videorate"] = tuple(data.get("videorate", (0, 1)))
+        return MediaInfo(**data)
+
 class Discoverer(gst.Pipeline):
     """
     Discovers information about files.
@@ -86,7 +184,9 @@ class Discoverer(gst.Pipeline):
     tags = {}
 
 
-    def __init__(self, filename, max_interleave=1.0):
+    def __init__(self, filename, max_interleave=1.0, fast=True,
+                 timeout=DISCOVER_TIMEOUT, max_timeout=DISCOVER_MAX_TIMEOUT,
+                 context=None, lookup=True):
         """
         filename: str; absolute path of the file to be discovered.
         max_interleave: int or float; the maximum frame interleave in seconds.
@@ -94,11 +194,38 @@ class Discoverer(gst.Pipeline):
             or the discoverer may not find out all input file's streams.
             The default value is 1 second and you shouldn't have to change it,
             changing it mean larger discovering time and bigger memory usage.
+        fast: bool; for common containers read the stream info from the
+            demuxer and parser caps without decoding anything. Falls back
+            to decoding when the fast probe fails.
+        timeout: int or float; give up after this many seconds without any
+            progress, i.e. no data read, new streams, caps or tags.
+        max_timeout: int or float; give up after this many seconds no matter
+            what, e.g. for slow network mounts or optical drives.
+        context: gobject.MainContext; run discovery on this context instead
+            of the default one, e.g. to discover from another thread.
+        lookup: bool; use the media info cache if the file hasn't changed.
+            Pass False if the cache was already checked, see get_cached().
         """
         gobject.GObject.__init__(self)
         
         self.filename = filename
-        
+        self._max_interleave = max_interleave
+        self._fast = fast and self._can_probe_fast(filename)
+        self._timeout = timeout
+        self._max_timeout = max_timeout
+        self._context = context
+        self._lookup = lookup
+
+        # How long the last discovery took in seconds, for instrumentation
+        self.discovery_time = 0.0
+
+        self._reset()
+        self._setup_source()
+
+    def _reset(self):
+        """
+        Reset all discovered information.
+        """
         self.mimetype = None
 
         self.audiocaps = {}
@@ -127,8 +254,29 @@ class Discoverer(gst.Pipeline):
         self._success = False
         self._nomorepads = False
 
-        self._timeoutid = 0
-        self._max_interleave = max_interleave
+        self._timeoutid = None
+        self._bus_handler = 0
+        self._finishing = False
+        self._stream_count = 0
+        self._caps_count = 0
+        self._progress = None
+
+    def _can_probe_fast(self, filename):
+        """
+        Whether filename is a local file in a container whose headers
+        describe all streams well enough to skip decoding.
+        """
+        if "://" in filename and not filename.startswith("file://"):
+            return False
+
+        ext = os.path.splitext(filename)[1].lower()[1:]
+        return ext in FAST_PROBE_EXTENSIONS
+
+    def _setup_source(self):
+        """
+        Create the source and decoder elements for the current mode.
+        """
+        filename = self.filename
         
         self.src = None
         self.dbin = None
@@ -152,6 +300,8 @@ class Discoverer(gst.Pipeline):
             pass
         elif filename.startswith("file://"):
             pass
+        elif self._fast:
+            filename = "file://" + os.path.abspath(filename)
         else:
             # uridecodebin fails to properly decode some files because it only
             # uses decodebin2 functionality.
@@ -179,11 +329,44 @@ class Discoverer(gst.Pipeline):
             self.dbin.connect("element-added", self._element_added_cb)
             self.dbin.connect("pad-added", self._new_decoded_pad_cb)
             self.dbin.connect("no-more-pads", self._no_more_pads_cb)
+            if self._fast:
+                self.dbin.connect("autoplug-continue",
+                                  self._autoplug_continue_cb)
+
+    def _autoplug_continue_cb(self, dbin, pad, caps):
+        """
+        Stop plugging parsers and decoders as soon as a stream's caps
+        describe everything we need to know about it.
+        """
+        struct = caps[0]
+        name = struct.get_name()
+        if name.startswith("video/") and not name.startswith("video/x-raw"):
+            fields = ["width", "height", "framerate"]
+        elif name.startswith("audio/") and not name.startswith("audio/x-raw"):
+            fields = ["rate", "channels"]
+        else:
+            return True
+
+        for field in fields:
+            if not struct.has_field(field):
+                return True
+
+        # Expose the stream as is if the fields are known, otherwise keep
+        # going and let a parser or decoder figure them out
+        return not caps.is_fixed()
 
     @property
     def length(self):
         return max(self.videolength, self.audiolength)
 
+    @property
+    def media_info(self):
+        """
+        The discovered information as a MediaInfo that does not keep this
+        pipeline alive.
+        """
+        return MediaInfo(self.filename, **self.as_dict())
+
     def _element_added_cb(self, bin, element):
         try:
             typefind = element.get_by_name("typefind")
@@ -208,23 +391,184 @@ class Discoverer(gst.Pipeline):
         else:
             self._finished(True)
 
+    def _get_progress(self):
+        """
+        Get a value that changes whenever discovery makes progress.
+        """
+        position = -1
+        src = self.src
+        if src is None and self.dbin.get_property("source"):
+            src = self.dbin.get_property("source")
+        if src is not None:
+            try:
+                position = src.query_position(gst.FORMAT_BYTES)[0]
+            except gst.QueryError:
+                pass
+
+        return (position, self._stream_count, self._caps_count,
+                len(self.tags))
+
+    def _check_progress(self):
+        now = time.time()
+        progress = self._get_progress()
+        if progress != self._progress:
+            self._progress = progress
+            self._progress_time = now
+
+        if now - self._start_time >= self._max_timeout or \
+           now - self._progress_time >= self._timeout:
+            self.debug("timed out")
+            self._timeoutid = None
+            self._timed_out_or_eos()
+            return False
+
+        return True
+
+    def _check_streams(self):
+        """
+        Finish as soon as all streams are known and have fixed caps.
+        """
+        if self._nomorepads and (self.is_audio or self.is_video) and \
+           ((not self.is_audio) or self.audiocaps) and \
+           ((not self.is_video) or self.videocaps):
+            self._finished(True)
+
+    def _add_idle(self, callback, *args):
+        """
+        Call callback from the main context used for discovery. Safe to
+        call from any thread.
+        """
+        if self._context is None:
+            return gobject.idle_add(callback, *args)
+
+        source = gobject.Idle()
+        source.set_callback(callback, *args)
+        source.attach(self._context)
+        return source
+
+    def _add_timeout(self, interval, callback):
+        """
+        Call callback every interval milliseconds from the main context used
+        for discovery until it returns False.
+        """
+        if self._context is None:
+            return gobject.timeout_add(interval, callback)
+
+        source = gobject.Timeout(interval)
+        source.set_callback(callback)
+        source.attach(self._context)
+        return source
+
+    def _remove_source(self, source):
+        if isinstance(source, gobject.Source):
+            source.destroy()
+        else:
+            gobject.source_remove(source)
+
+    def _sync_message_cb(self, bus, message):
+        # Called from streaming threads, handle it on our own context
+        self._add_idle(self._bus_message_cb, bus, message)
+
     def _finished(self, success=False):
         self.debug("success:%d" % success)
+        if self._finishing:
+            return False
+        self._finishing = True
         self._success = success
-        self.bus.remove_signal_watch()
-        if self._timeoutid:
-            gobject.source_remove(self._timeoutid)
-            self._timeoutid = 0
-        gobject.idle_add(self._stop)
+        if self._bus_handler:
+            self.bus.disconnect(self._bus_handler)
+            self._bus_handler = 0
+        if self._context is None:
+            self.bus.remove_signal_watch()
+        else:
+            self.bus.disable_sync_message_emission()
+        if self._timeoutid is not None:
+            self._remove_source(self._timeoutid)
+            self._timeoutid = None
+        self._add_idle(self._stop)
         return False
 
     def _stop(self):
         self.debug("success:%d" % self._success)
+        if self._fast and not self._success:
+            # The headers weren't enough, try again and decode this time
+            _log.debug(_("Fast probe failed for %(filename)s, decoding") % {
+                "filename": self.filename
+            })
+            self.set_state(gst.STATE_NULL)
+            for element in list(self.elements()):
+                self.remove(element)
+            self._fast = False
+            self._reset()
+            self._setup_source()
+            started = self._start_time
+            self.discover()
+            # The time limit and discovery time cover both attempts
+            self._start_time = started
+            return False
         self.finished = True
         self.set_state(gst.STATE_READY)
+        self.discovery_time = time.time() - self._start_time
+        _log.debug(_("Discovered %(filename)s in %(time).3fs") % {
+            "filename": self.filename,
+            "time": self.discovery_time,
+        })
+        if self._success:
+            infocache.store(self.filename, self.as_dict())
         self.debug("about to emit signal")
         self.emit('discovered', self._success)
 
+    def as_dict(self):
+        """
+        Get the discovered information as a dict of plain values, e.g. for
+        the media info cache or JSON output. Caps are stored as strings and
+        tags that aren't plain values are converted to strings.
+        """
+        tags = {}
+        for key, value in self.tags.items():
+            if not isinstance(value, (bool, int, long, float, basestring)):
+                value = str(value)
+            tags[key] = value
+
+        return {
+            "mimetype": self.mimetype,
+            "audiocaps": self.audiocaps and self.audiocaps.to_string() or None,
+            "videocaps": self.videocaps and self.videocaps.to_string() or None,
+            "videowidth": self.videowidth,
+            "videoheight": self.videoheight,
+            "videorate": (self.videorate.num, self.videorate.denom),
+            "audiofloat": self.audiofloat,
+            "audiorate": self.audiorate,
+            "audiodepth": self.audiodepth,
+            "audiowidth": self.audiowidth,
+            "audiochannels": self.audiochannels,
+            "audiolength": self.audiolength,
+            "videolength": self.videolength,
+            "is_video": self.is_video,
+            "is_audio": self.is_audio,
+            "otherstreams": list(self.otherstreams),
+            "tags": tags,
+        }
+
+    def _set_cache_fields(self, fields):
+        """
+        Restore discovered information from the media info cache.
+        """
+        for key, value in fields.items():
+            if key in ["audiocaps", "videocaps"]:
+                value = value and gst.Caps(value) or {}
+            elif key == "videorate":
+                value = gst.Fraction(*value)
+            elif key in ["otherstreams", "tags"]:
+                value = type(value)(value)
+            setattr(self, key, value)
+
+    def _emit_cached(self):
+        self.finished = True
+        self._success = True
+        self.emit('discovered', True)
+        return False
+
     def _bus_message_cb(self, bus, message):
         if message.type == gst.MESSAGE_EOS:
             self.debug("Got EOS")
@@ -246,12 +590,28 @@ class Discoverer(gst.Pipeline):
             self.emit('discovered', False)
             return
 
+        cached = self._lookup and infocache.lookup(self.filename) or None
+        if cached is not None:
+            _log.debug(_("Using cached info for %(filename)s") % {
+                "filename": self.filename
+            })
+            self._set_cache_fields(cached)
+            self._add_idle(self._emit_cached)
+            return
+
         self.bus = self.get_bus()
-        self.bus.add_signal_watch()
-        self.bus.connect("message", self._bus_message_cb)
+        if self._context is None:
+            self.bus.add_signal_watch()
+            self._bus_handler = self.bus.connect("message",
+                                                 self._bus_message_cb)
+        else:
+            self.bus.enable_sync_message_emission()
+            self._bus_handler = self.bus.connect("sync-message",
+                                                 self._sync_message_cb)
 
-        # 3s timeout
-        self._timeoutid = gobject.timeout_add(3000, self._timed_out_or_eos)
+        # Time out when no progress is being made or the ceiling is hit
+        self._start_time = self._progress_time = time.time()
+        self._timeoutid = self._add_timeout(250, self._check_progress)
         
         self.info("setting to PLAY")
         if not self.set_state(gst.STATE_PLAYING):
@@ -314,6 +674,7 @@ class Discoverer(gst.Pipeline):
     def _no_more_pads_cb(self, dbin):
         self.info("no more pads")
         self._nomorepads = True
+        self._check_streams()
 
     def _unknown_type_cb(self, dbin, pad, caps):
         self.debug("unknown type : %s" % caps.to_string())
@@ -333,6 +694,7 @@ class Discoverer(gst.Pipeline):
             pad.info("no negotiated caps available")
             return
         pad.info("caps:%s" % caps.to_string())
+        self._caps_count += 1
         # the caps are fixed
         # We now get the total length of that stream
         q = gst.query_new_duration(gst.FORMAT_TIME)
@@ -354,14 +716,18 @@ class Discoverer(gst.Pipeline):
                 while not cap.has_key("rate"):
                     pos += 1
                     cap = caps[pos]
+                # Encoded audio exposed by the fast probe, e.g. audio/mpeg,
+                # has no width
                 self.audiorate = cap["rate"]
-                self.audiowidth = cap["width"]
-                self.audiochannels = cap["channels"]
+                if cap.has_key("width"):
+                    self.audiowidth = cap["width"]
+                if cap.has_key("channels"):
+                    self.audiochannels = cap["channels"]
             except IndexError:
                 pass
             if "x-raw-float" in caps.to_string():
                 self.audiofloat = True
-            else:
+            elif caps[0].has_key("depth"):
                 self.audiodepth = caps[0]["depth"]
             if self._nomorepads and ((not self.is_video) or self.videocaps):
                 self._finished(True)
@@ -375,8 +741,10 @@ class Discoverer(gst.Pipeline):
                     pos += 1
                     cap = caps[pos]
                 self.videowidth = cap["width"]
-                self.videoheight = cap["height"]
-                self.videorate = cap["framerate"]
+                if cap.has_key("height"):
+                    self.videoheight = cap["height"]
+                if cap.has_key("framerate"):
+                    self.videorate = cap["framerate"]
             except IndexError:
                 pass
             if self._nomorepads and ((not self.is_audio) or self.audiocaps):
@@ -402,6 +770,7 @@ class Discoverer(gst.Pipeline):
         fakesink = gst.element_factory_make("fakesink", "fakesink%d-%s" % 
             (self.sinknumber, "audio" in caps.to_string() and "audio" or "video"))
         self.sinknumber += 1
+        self._stream_count += 1
         queue = gst.element_factory_make("queue")
         # we want the queue to buffer up to the specified amount of data 
         # before outputting. This enables us to cope with formats 
@@ -435,3 +804,104 @@ class Discoverer(gst.Pipeline):
         queue.set_state(gst.STATE_PLAYING)
         fakesink.set_state(gst.STATE_PLAYING)
         gst.info('finished here')
+
+def get_cached(filename):
+    """
+    Get the information about a file from the media info cache without
+    building a discovery pipeline.
+
+    filename: str; the file or URI to look up.
+
+    Returns a MediaInfo or None if the file isn't cached or has changed.
+    """
+    cached = infocache.lookup(filename)
+    if cached is None:
+        return None
+
+    return MediaInfo.from_dict(dict(cached, filename=filename))
+
+def discover_many(paths, concurrency=4, max_interleave=1.0, fast=True):
+    """
+    Discover many files, running up to concurrency discoverers at once.
+    This is a generator that yields results as they arrive, which is not
+    necessarily the order of paths. It iterates the default main context
+    itself, so there is no need to run a main loop.
+
+    paths: iterable of str; the files to discover, consumed lazily.
+    concurrency: int; the maximum number of discoverers running at once.
+    fast: bool; use the fast header-only probe where possible.
+
+    Yields (filename, info, is_media, seconds) tuples where info is a
+    MediaInfo and seconds is the time it took to discover that file.
+    """
+    paths = iter(paths)
+    context = gobject.main_context_default()
+    running = {}
+    results = []
+
+    def _discovered(discoverer, is_media):
+        started = running.pop(discoverer)
+        # Free the pipeline, only the discovered information is needed now
+        discoverer.set_state(gst.STATE_NULL)
+        results.append((discoverer.filename, discoverer.media_info, is_media,
+                        time.time() - started))
+
+    while True:
+        while len(running) < concurrency:
+            try:
+                filename = paths.next()
+            except StopIteration:
+                break
+
+            started = time.time()
+            info = get_cached(filename)
+            if info is not None:
+                results.append((filename, info, True, time.time() - started))
+                continue
+
+            discoverer = Discoverer(filename, max_interleave, fast,
+                                    lookup=False)
+            discoverer.connect("discovered", _discovered)
+            running[discoverer] = time.time()
+            discoverer.discover()
+
+        while results:
+            yield results.pop(0)
+
+        if not running:
+            break
+
+        context.iteration(True)
+
+def probe(filename, timeout=DISCOVER_MAX_TIMEOUT, fast=True):
+    """
+    Discover a file and block until done. Discovery runs on a private main
+    context, so no main loop is needed and it is safe to call this from
+    several threads at once (call gobject.threads_init() first).
+
+    filename: str; the file or URI to discover.
+    timeout: int or float; the maximum number of seconds to spend.
+    fast: bool; use the fast header-only probe where possible.
+
+    Returns a MediaInfo. Use its is_video and is_audio attributes to check
+    whether the file contains any media.
+    """
+    info = get_cached(filename)
+    if info is not None:
+        return info
+
+    context = gobject.MainContext()
+    done = []
+
+    discoverer = Discoverer(filename, fast=fast, max_timeout=timeout,
+                            context=context, lookup=False)
+    discoverer.connect("discovered", lambda d, is_media: done.append(is_media))
+    discoverer.discover()
+
+    while not done:
+        context.iteration(True)
+
+    info = discoverer.media_info
+    discoverer.set_state(gst.STATE_NULL)
+
+    return info
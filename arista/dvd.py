@@ -24,25 +24,98 @@
     <http://www.gnu.org/licenses/>.
 """
 
+import gettext
+import logging
+
 import gobject
 import subprocess
 
+_ = gettext.gettext
+_log = logging.getLogger("arista.dvd")
+
+# Disc ID => parsed lsdvd output, so a disc is only ever scanned once
+_cache = {}
+
+# The ISO9660 primary volume descriptor starts at sector 16
+ISO_PVD_OFFSET = 16 * 2048
+
+def get_disc_id(path):
+    """
+        Get an identifier for the disc in a drive or a DVD image by reading
+        the volume ID and creation date from its ISO9660 primary volume
+        descriptor. This only reads a couple of kilobytes and is much
+        faster than scanning the disc.
+        
+        @type path: str
+        @param path: The DVD device or image path
+        @rtype: str
+        @return: The disc ID or None if it cannot be read
+    """
+    try:
+        f = open(path, "rb")
+        try:
+            f.seek(ISO_PVD_OFFSET)
+            pvd = f.read(2048)
+        finally:
+            f.close()
+    except IOError:
+        return None
+    
+    if len(pvd) < 830 or pvd[1:6] != "CD001":
+        return None
+    
+    # Volume ID, volume space size, creation date
+    return "%s-%s-%s" % (pvd[40:72].strip(), pvd[80:84].encode("hex"),
+                         pvd[813:830])
+
+def get_longest_title(lsdvd):
+    """
+        Find the title most likely to be the main feature.
+        
+        @type lsdvd: dict
+        @param lsdvd: The parsed lsdvd output, see DvdInfo
+        @rtype: int
+        @return: The title index or None if the disc has no titles
+    """
+    longest = None
+    for track in lsdvd.get("track", []):
+        if longest is None or track["length"] > longest["length"]:
+            longest = track
+    
+    return longest and longest["ix"] or None
+
 class DvdInfo(gobject.GObject):
     """
         Get info about a DVD using an external process running lsdvd. Emits
-        a GObject signal when ready with the DVD info.
+        a GObject signal when ready with the DVD info. Results are cached
+        per disc so asking again for the same disc is immediate.
     """
     __gsignals__ = {
         "ready": (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE,  (gobject.TYPE_PYOBJECT,)),
+        "error": (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, tuple()),
     }
 
     def __init__(self, path):
         gobject.GObject.__init__(self)
         self.path = path
+        self.disc_id = get_disc_id(path)
+        
+        if self.disc_id and self.disc_id in _cache:
+            _log.debug(_("Using cached DVD info for %(id)s") % {
+                "id": self.disc_id,
+            })
+            self.proc = None
+            gobject.idle_add(self._emit_cached)
+            return
+        
         self.proc = subprocess.Popen('lsdvd -x -Oy %s' % path, stdout=subprocess.PIPE, shell=True)
 
         gobject.timeout_add(100, self.run)
 
+    def _emit_cached(self):
+        self.emit("ready", _cache[self.disc_id])
+        return False
+
     def run(self):
         # Check if we have the info, if not, return and we will be called
         # again to check in 100ms.
@@ -50,11 +123,17 @@ class DvdInfo(gobject.GObject):
             if self.proc.returncode == 0:
                 # TODO: is there a safer way to do this?
                 exec(self.proc.stdout.read())
+                if self.disc_id:
+                    _cache[self.disc_id] = lsdvd
                 self.emit("ready", lsdvd)
+            else:
+                _log.warning(_("Unable to read DVD info from %(path)s") % {
+                    "path": self.path,
+                })
+                self.emit("error")
             
             return False
 
         return True
 
 gobject.type_register(DvdInfo)
-
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+    Arista Encode History
+    =====================
+    Records how fast presets encode on this machine so that encode time and
+    output size can be estimated before a job is started.
+
+    Example Use
+    -----------
+    Completed transcodes are recorded automatically. To estimate a job:
+
+        >>> arista.history.estimate(preset, 90 * 60)
+        (1800.0, 734003200)
+
+    License
+    -------
+    Copyright 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import gettext
+import logging
+import os
+
+import utils
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.history")
+
+_history = None
+
+def _get_key(preset):
+    """
+        Get the key used to store history for a preset.
+
+        @type preset: arista.presets.Preset
+        @param preset: The preset
+        @rtype: str
+        @return: The preset slug or just its name for unsaved devices
+    """
+    try:
+        return preset.slug
+    except (AttributeError, TypeError):
+        return preset.name
+
+def _load():
+    """
+        Load the history file once.
+
+        @rtype: dict
+        @return: A dictionary of preset keys to recorded totals
+    """
+    global _history
+
+    if _history is None:
+        _history = {}
+        path = utils.get_write_path("history.json", default="")
+        if path and os.path.exists(path):
+            try:
+                _history = json.loads(open(path).read())
+            except ValueError, e:
+                _log.warning(_("Unable to load encode history: %(error)s") % {
+                    "error": str(e),
+                })
+
+    return _history
+
+def get(preset):
+    """
+        Get the recorded totals for a preset.
+
+        @type preset: arista.presets.Preset
+        @param preset: The preset
+        @rtype: dict
+        @return: A dict of "media" (seconds of input), "elapsed" (wall
+                 seconds spent encoding), "size" (output bytes) and "count"
+                 or None if the preset has never been used
+    """
+    return _load().get(_get_key(preset))
+
+def record(preset, media, elapsed, size):
+    """
+        Record a completed encode.
+
+        @type preset: arista.presets.Preset
+        @param preset: The preset that was used
+        @type media: float
+        @param media: The input duration in seconds that was encoded
+        @type elapsed: float
+        @param elapsed: The wall time in seconds the encode took
+        @type size: int
+        @param size: The output size in bytes
+    """
+    if media <= 0 or elapsed <= 0:
+        return
+
+    history = _load()
+    entry = history.setdefault(_get_key(preset), {
+        "media": 0.0,
+        "elapsed": 0.0,
+        "size": 0,
+        "count": 0,
+    })
+    entry["media"] += media
+    entry["elapsed"] += elapsed
+    entry["size"] += size
+    entry["count"] += 1
+
+    path = utils.get_write_path("history.json", default="")
+    if not path:
+        return
+
+    try:
+        open(path + ".tmp", "w").write(json.dumps(history, indent=4))
+        os.rename(path + ".tmp", path)
+    except (IOError, OSError), e:
+        _log.warning(_("Unable to save encode history: %(error)s") % {
+            "error": str(e),
+        })
+
+def estimate(preset, duration):
+    """
+        Estimate the encode time and output size for an input.
+
+        @type preset: arista.presets.Preset
+        @param preset: The preset to encode with
+        @type duration: float
+        @param duration: The input duration in seconds
+        @rtype: tuple
+        @return: The estimated wall time in seconds and output size in bytes
+                 or (None, None) if there is no history for this preset
+    """
+    entry = get(preset)
+    if not entry or not entry["media"]:
+        return None, None
+
+    return duration * entry["elapsed"] / entry["media"], \
+           int(duration * entry["size"] / entry["media"])
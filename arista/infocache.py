@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+
+"""
+    Arista Media Info Cache
+    =======================
+    A persistent on-disk cache of discovered media information so that files
+    which have not changed since they were last discovered do not need to be
+    decoded again.
+
+    Example Use
+    -----------
+    The discoverer uses this cache automatically. It can also be used
+    directly:
+
+        >>> arista.infocache.lookup("/home/dan/movie.avi")
+        {"is_video": True, "videowidth": 640, ...}
+
+    License
+    -------
+    Copyright 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import anydbm
+import atexit
+import gettext
+import logging
+import os
+import shelve
+import threading
+import time
+import urllib
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking, e.g. on Windows
+    fcntl = None
+
+import utils
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.infocache")
+
+# The maximum number of files to keep info for. When exceeded the least
+# recently used quarter of the entries is evicted.
+MAX_ENTRIES = 20000
+
+# Set to False to disable the cache completely
+enabled = True
+
+# The database must not be opened by several threads at once. Other
+# processes are kept out by locking a file next to it, see _open.
+_lock = threading.Lock()
+
+# Keys of entries that were used since the database was last written, and
+# when. Lookups only read the database, the access times are written with
+# the next store or on exit.
+_touched = {}
+
+def get_cache_path():
+    """
+        @rtype: str
+        @return: The path to the cache database or an empty string if
+                 there is no writable location
+    """
+    return utils.get_write_path("cache", "mediainfo", default="")
+
+def _get_local_path(uri):
+    """
+        Get the local file path of a URI or path, if it is a local file.
+
+        @type uri: str
+        @param uri: A path or URI as passed to the discoverer
+        @rtype: str
+        @return: The absolute local path or None if not a local file
+    """
+    if uri.startswith("file://"):
+        return os.path.abspath(urllib.url2pathname(uri[7:]))
+    elif "://" in uri:
+        # DVD, V4L, network streams, etc can't be cached
+        return None
+    else:
+        return os.path.abspath(uri)
+
+def _get_key(path):
+    """
+        @rtype: str
+        @return: The database key for a local path
+    """
+    if isinstance(path, unicode):
+        path = path.encode("utf-8")
+
+    return path
+
+def _get_stat(path):
+    """
+        @rtype: list
+        @return: The size, modification time and inode of a file or None
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return [st.st_size, st.st_mtime, st.st_ino]
+
+class _Database(object):
+    """
+        The opened cache database together with the lock on it. Callers
+        must close it when done so that several processes can share the
+        cache.
+    """
+    def __init__(self, db, lockfile):
+        self.db = db
+        self.lockfile = lockfile
+    
+    def close(self):
+        try:
+            self.db.close()
+        finally:
+            if self.lockfile is not None:
+                fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_UN)
+                self.lockfile.close()
+
+def _open(flag="c"):
+    """
+        Open and lock the cache database. Readers share the lock, writers
+        hold it alone.
+
+        @rtype: _Database
+        @return: The opened database or None if it cannot be opened
+    """
+    path = get_cache_path()
+    if not path:
+        return None
+
+    lockfile = None
+    if fcntl is not None:
+        try:
+            lockfile = open(path + ".lock", "a")
+            fcntl.flock(lockfile.fileno(), flag == "r" and fcntl.LOCK_SH or \
+                                           fcntl.LOCK_EX)
+        except IOError, e:
+            if lockfile is not None:
+                lockfile.close()
+            _log.warning(_("Unable to lock media info cache: %(error)s") % {
+                "error": str(e),
+            })
+            return None
+
+    try:
+        return _Database(shelve.open(path, flag=flag, protocol=2), lockfile)
+    except anydbm.error, e:
+        if lockfile is not None:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+            lockfile.close()
+        if flag != "r":
+            _log.warning(_("Unable to open media info cache: %(error)s") % {
+                "error": str(e),
+            })
+        return None
+
+def lookup(uri):
+    """
+        Get cached information about a file. This only reads the cache, so
+        entries for files that have changed since they were cached are
+        replaced by the next store().
+
+        @type uri: str
+        @param uri: A path or URI as passed to the discoverer
+        @rtype: dict
+        @return: The cached fields or None on a cache miss
+    """
+    if not enabled:
+        return None
+
+    path = _get_local_path(uri)
+    if not path:
+        return None
+
+    stat = _get_stat(path)
+    if not stat:
+        return None
+
+    _lock.acquire()
+    try:
+        return _lookup(path, stat)
+    finally:
+        _lock.release()
+
+def _lookup(path, stat):
+    opened = _open("r")
+    if opened is None:
+        return None
+
+    try:
+        key = _get_key(path)
+        entry = opened.db.get(key)
+        if entry is None or entry["stat"] != stat:
+            return None
+
+        _touched[key] = time.time()
+
+        return entry["info"]
+    finally:
+        opened.close()
+
+def store(uri, info):
+    """
+        Cache information about a file.
+
+        @type uri: str
+        @param uri: A path or URI as passed to the discoverer
+        @type info: dict
+        @param info: The fields to cache, which must be picklable
+    """
+    if not enabled:
+        return
+
+    path = _get_local_path(uri)
+    if not path:
+        return
+
+    stat = _get_stat(path)
+    if not stat:
+        return
+
+    _lock.acquire()
+    try:
+        _store(path, stat, info)
+    finally:
+        _lock.release()
+
+def _store(path, stat, info):
+    opened = _open()
+    if opened is None:
+        return
+
+    try:
+        db = opened.db
+        key = _get_key(path)
+        _touched.pop(key, None)
+        db[key] = {
+            "stat": stat,
+            "atime": time.time(),
+            "info": info,
+        }
+
+        _write_touched(db)
+
+        if len(db) > MAX_ENTRIES:
+            _evict(db)
+    finally:
+        opened.close()
+
+def _write_touched(db):
+    """
+        Write the access times of entries used since the last write.
+    """
+    for key, atime in _touched.items():
+        entry = db.get(key)
+        if entry is not None:
+            entry["atime"] = atime
+            db[key] = entry
+
+    _touched.clear()
+
+def flush():
+    """
+        Write the access times of entries used since the last write. This
+        is called automatically on exit.
+    """
+    _lock.acquire()
+    try:
+        if _touched:
+            opened = _open()
+            if opened is not None:
+                try:
+                    _write_touched(opened.db)
+                finally:
+                    opened.close()
+    finally:
+        _lock.release()
+
+atexit.register(flush)
+
+def _evict(db):
+    """
+        Remove the least recently used quarter of all entries.
+    """
+    entries = sorted([(db[key]["atime"], key) for key in db.keys()])
+    for atime, key in entries[:len(entries) / 4]:
+        del db[key]
+
+    _log.debug(_("Evicted %(count)d media info cache entries") % {
+        "count": len(entries) / 4,
+    })
+
+def clear():
+    """
+        Remove all cached information.
+    """
+    _lock.acquire()
+    try:
+        _touched.clear()
+        opened = _open("n")
+        if opened is not None:
+            try:
+                # The dumbdbm fallback doesn't truncate for the "n" flag
+                opened.db.clear()
+            finally:
+                opened.close()
+    finally:
+        _lock.release()
@@ -7,7 +7,9 @@
     
     Example Use
     -----------
-    Presets are automatically loaded when the module is initialized.
+    Presets are automatically loaded the first time they are accessed.
+    Only the devices that are actually used get built from the compiled
+    preset cache.
     
         >>> import arista.presets
         >>> arista.presets.get()
@@ -44,30 +46,111 @@ try:
 except ImportError:
     import simplejson as json
 
+import cPickle
 import gettext
+import hashlib
+import httplib
 import shutil
 import logging
 import os
-import subprocess
+import socket
 import sys
 import tarfile
+import tempfile
+import threading
+import time
 import urllib2
-
-import gobject
-import gst
-import gst.pbutils
+import urlparse
+import StringIO
+import UserDict
 
 import utils
 
 _ = gettext.gettext
-_presets = {}
+_presets = None
 _log = logging.getLogger("arista.presets")
 
-class Fraction(gst.Fraction):
+# Bump when the format of the compiled preset cache changes
+CACHE_VERSION = 1
+
+# Timeout in seconds for requests to a preset repository
+UPDATE_TIMEOUT = 30
+
+# Size in bytes of the blocks preset archives are downloaded, written and
+# extracted in
+CHUNK_SIZE = 64 * 1024
+
+# Elements the transcoder uses internally for every preset
+INTERNAL_ELEMENTS = [
+    "decodebin2",
+    "videobox",
+    "ffmpegcolorspace",
+    "videoscale",
+    "videorate",
+    "ffdeinterlace",
+    "audioconvert",
+    "audiorate",
+    "audioresample",
+    "tee",
+    "queue",
+]
+
+# The names of all elements in the GStreamer registry, built on first use
+# and dropped after plugins were installed, see reset_available_elements
+_elements = None
+
+# The name of the list of SHA-256 digests in exported preset archives, in
+# the format used by sha256sum
+MANIFEST_NAME = "manifest.sha256"
+
+class PresetArchiveException(Exception):
+    """
+        An exception to be thrown when a preset archive is invalid or its
+        contents don't match its manifest.
+    """
+    pass
+
+def _copy(source, destination):
     """
-        An object for storing a fraction as two integers. This is a subclass
-        of gst.Fraction that allows initialization from a string representation
-        like "1/2".
+        Copy one file object to another in blocks.
+        
+        @rtype: str
+        @return: The hex SHA-256 digest of the copied data
+    """
+    digest = hashlib.sha256()
+    while True:
+        data = source.read(CHUNK_SIZE)
+        if not data:
+            break
+        digest.update(data)
+        destination.write(data)
+    
+    return digest.hexdigest()
+
+def _get_digest(filename):
+    """
+        @rtype: str
+        @return: The hex SHA-256 digest of a file
+    """
+    digest = hashlib.sha256()
+    f = open(filename, "rb")
+    try:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    finally:
+        f.close()
+    
+    return digest.hexdigest()
+
+class Fraction(object):
+    """
+        An object for storing a fraction as two integers that allows
+        initialization from a string representation like "1/2". It has the
+        same num and denom attributes as gst.Fraction, but doesn't need
+        GStreamer so presets can be loaded without it.
     """
     def __init__(self, value = "1"):
         """
@@ -78,13 +161,31 @@ class Fraction(gst.Fraction):
         parts = str(value).split("/")
         
         if len(parts) == 1:
-            gst.Fraction.__init__(self, int(value), 1)
+            self.num, self.denom = int(value), 1
         elif len(parts) == 2:
-            gst.Fraction.__init__(self, int(parts[0]), int(parts[1]))
+            self.num, self.denom = int(parts[0]), int(parts[1])
         else:
             raise ValueError(_("Not a valid integer or fraction: %(value)s!") % {
                 "value": value,
             })
+    
+    def __float__(self):
+        return self.num / float(self.denom)
+    
+    def __cmp__(self, other):
+        if isinstance(other, Fraction):
+            return cmp(self.num * other.denom, other.num * self.denom)
+        
+        return cmp(float(self), other)
+    
+    def __str__(self):
+        if self.denom == 1:
+            return "%d" % self.num
+        
+        return "%d/%d" % (self.num, self.denom)
+    
+    def __repr__(self):
+        return "<Fraction %d/%d>" % (self.num, self.denom)
 
 class Author(object):
     """
@@ -212,7 +313,7 @@ class Device(object):
         for name, preset in self.presets.items():
             rates = []
             for x in preset.acodec.rate[0], preset.acodec.rate[1], preset.vcodec.rate[0], preset.vcodec.rate[1]:
-                if isinstance(x, gst.Fraction):
+                if isinstance(x, Fraction):
                     if x.denom == 1:
                         rates.append("%s" % x.num)
                     else:
@@ -264,28 +365,60 @@ class Device(object):
         """
             Export this device and all presets to a file. Creates a bzipped
             tarball of the JSON and all associated images that can be easily
-            imported later.
+            imported later. The first member of the tarball is a manifest
+            of the SHA-256 digests of all other members, which is checked
+            on import.
+            
+            @type filename: str
+            @param filename: The path of the tarball to write
         """
         # Make sure all changes are saved
         self.save()
         
+        directory = os.path.dirname(self.filename)
+        
         # Gather image files
         images = set()
-        for name, preset in self.presets.items():
-            if preset.icon:
-                images.add(preset.icon[7:])
+        for icon in [self.icon] + [x.icon for x in self.presets.values()]:
+            if icon and icon.startswith("file://") and \
+               os.path.exists(os.path.join(directory, icon[7:])):
+                images.add(icon[7:])
+        
+        files = list(images) + [os.path.basename(self.filename)]
         
-        files = " ".join([os.path.basename(self.filename)] + list(images))
+        manifest = ""
+        for name in files:
+            manifest += "%s  %s\n" % (_get_digest(os.path.join(directory,
+                                                                name)), name)
+        
+        tar = tarfile.open(filename + ".tmp", "w|bz2")
+        try:
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size = len(manifest)
+            info.mtime = time.time()
+            tar.addfile(info, StringIO.StringIO(manifest))
+            
+            for name in files:
+                tar.add(os.path.join(directory, name), name)
+        finally:
+            tar.close()
         
-        cwd = os.getcwd()
-        os.chdir(os.path.dirname(self.filename))
-        subprocess.call("tar -cjf %s %s" % (filename, files), shell=True)
-        os.chdir(cwd)
+        os.rename(filename + ".tmp", filename)
     
     @staticmethod
     def from_json(data):
-        parsed = json.loads(data)
-
+        return Device.from_dict(json.loads(data))
+    
+    @staticmethod
+    def from_dict(parsed):
+        """
+            Create a device from parsed JSON data.
+            
+            @type parsed: dict
+            @param parsed: The parsed contents of a device JSON file
+            @rtype: Device
+            @return: A new device instance
+        """
         device = Device(**{
             "make": parsed.get("make", "Generic"),
             "model": parsed.get("model", ""),
@@ -391,6 +524,37 @@ class Preset(object):
         
         return slug.replace(" ", "_").replace("'", "").replace("/", "")
     
+    @property
+    def required_elements(self):
+        """
+            @rtype: list
+            @return: The names of all GStreamer elements needed to encode
+                     with this preset
+        """
+        # Only the factory name counts, e.g. "mp4mux faststart=1"
+        elements = [x.split()[0] for x in [self.container, self.acodec.name,
+                                           self.vcodec.name] if x and x.strip()]
+        
+        return elements + INTERNAL_ELEMENTS
+    
+    @property
+    def missing_elements(self):
+        """
+            @rtype: list
+            @return: The names of required elements that are not installed
+        """
+        available = get_available_elements()
+        
+        return [x for x in self.required_elements if x not in available]
+    
+    @property
+    def can_encode(self):
+        """
+            @rtype: bool
+            @return: Whether all elements needed by this preset are installed
+        """
+        return not self.missing_elements
+    
     def check_elements(self, callback, *args):
         """
             Check the elements used in this preset. If they don't exist then
@@ -402,50 +566,31 @@ class Preset(object):
             @rtype: bool
             @return: True if required elements are available, False otherwise
         """
-        elements = [
-            # Elements defined in external files
-            self.container,
-            self.acodec.name,
-            self.vcodec.name,
-            # Elements used internally
-            "decodebin2",
-            "videobox",
-            "ffmpegcolorspace",
-            "videoscale",
-            "videorate",
-            "ffdeinterlace",
-            "audioconvert",
-            "audiorate",
-            "audioresample",
-            "tee",
-            "queue",
-        ]
-        
-        missing = []
-        missingdesc = ""
-        for element in elements:
-            if not gst.element_factory_find(element):
-                missing.append(gst.pbutils.missing_element_installer_detail_new(element))
-                if missingdesc:
-                    missingdesc += ", %s" % element
-                else:
-                    missingdesc += element
+        import gobject
+        import gst
+        import gst.pbutils
+        
+        missing = self.missing_elements
         
         if missing:
-            _log.info("Attempting to install elements: %s" % missingdesc)
+            _log.info("Attempting to install elements: %s" % ", ".join(missing))
             if gst.pbutils.install_plugins_supported():
                 def install_done(result, null):
                     if result == gst.pbutils.INSTALL_PLUGINS_INSTALL_IN_PROGRESS:
                         # Ignore start of installer message
                         pass
                     elif result == gst.pbutils.INSTALL_PLUGINS_SUCCESS:
+                        gst.update_registry()
+                        reset_available_elements()
                         callback(self, True, *args)
                     else:
                         _log.error("Unable to install required elements!")
                         callback(self, False, *args)
             
+                details = [gst.pbutils.missing_element_installer_detail_new(x) \
+                           for x in missing]
                 context = gst.pbutils.InstallPluginsContext()
-                gst.pbutils.install_plugins_async(missing, context,
+                gst.pbutils.install_plugins_async(details, context,
                                                   install_done, "")
             else:
                 _log.error("Installing elements not supported!")
@@ -499,6 +644,92 @@ class VideoCodec(Codec):
         self.height = height and height or (2, 1080)
         self.transform = transform
 
+class DeviceIndex(UserDict.DictMixin):
+    """
+        A dictionary of device short names to Device objects. Devices are
+        only built from their parsed JSON data the first time they are
+        accessed, so listing or looking up a single device doesn't have to
+        create every Device and Preset object.
+    """
+    def __init__(self):
+        self._devices = {}
+        self._entries = {}
+        
+        # Incremented whenever a device is added or removed
+        self.generation = 0
+    
+    def add(self, name, filename, data):
+        """
+            Add a device that will be built when it is first accessed.
+            
+            @type name: str
+            @param name: The device short name
+            @type filename: str
+            @param filename: The path to the device JSON file
+            @type data: dict
+            @param data: The parsed contents of the device JSON file
+        """
+        self._devices.pop(name, None)
+        self._entries[name] = (filename, data)
+        self.generation += 1
+    
+    def __getitem__(self, name):
+        if name not in self._devices:
+            filename, data = self._entries[name]
+            device = Device.from_dict(data)
+            device.filename = filename
+            
+            _log.debug(_("Loaded device %(device)s (%(presets)d presets)") % {
+                "device": device.name,
+                "presets": len(device.presets),
+            })
+            
+            self._devices[name] = device
+        
+        return self._devices[name]
+    
+    def __setitem__(self, name, device):
+        self._entries.pop(name, None)
+        self._devices[name] = device
+        self.generation += 1
+    
+    def __delitem__(self, name):
+        if name not in self._devices and name not in self._entries:
+            raise KeyError(name)
+        
+        self._devices.pop(name, None)
+        self._entries.pop(name, None)
+        self.generation += 1
+    
+    def __contains__(self, name):
+        return name in self._devices or name in self._entries
+    
+    def get_version(self, name):
+        """
+            Get the version of a device without building it.
+            
+            @type name: str
+            @param name: The device short name
+            @rtype: str
+            @return: The version of the device presets
+        """
+        if name in self._devices:
+            return self._devices[name].version
+        
+        return self._entries[name][1].get("version", "")
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def keys(self):
+        return list(set(self._devices.keys()) | set(self._entries.keys()))
+    
+    def __repr__(self):
+        return repr(dict(self.items()))
+
 def load(filename):
     """
         Load a filename into a new Device.
@@ -519,34 +750,220 @@ def load(filename):
     
     return device
 
+def _get_cache_path():
+    """
+        @rtype: str
+        @return: The path to the compiled preset cache or an empty string if
+                 there is no writable location
+    """
+    return utils.get_write_path("cache", "presets", default="")
+
+def _load_cache():
+    """
+        Load the compiled preset cache.
+        
+        @rtype: dict
+        @return: A dictionary of directory paths to their cached entries
+    """
+    path = _get_cache_path()
+    if not path or not os.path.exists(path):
+        return {}
+    
+    try:
+        cache = cPickle.load(open(path, "rb"))
+    except Exception, e:
+        _log.warning(_("Unable to load preset cache: %(error)s") % {
+            "error": str(e),
+        })
+        return {}
+    
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    
+    return cache["directories"]
+
+def _save_cache(directories):
+    """
+        Save the compiled preset cache.
+        
+        @type directories: dict
+        @param directories: A dictionary of directory paths to their entries
+    """
+    path = _get_cache_path()
+    if not path:
+        return
+    
+    try:
+        f = open(path + ".tmp", "wb")
+        cPickle.dump({
+            "version": CACHE_VERSION,
+            "directories": directories,
+        }, f, 2)
+        f.close()
+        os.rename(path + ".tmp", path)
+    except (IOError, OSError), e:
+        _log.warning(_("Unable to save preset cache: %(error)s") % {
+            "error": str(e),
+        })
+
+def _get_mtime(path):
+    """
+        @rtype: float
+        @return: The modification time of a path or None if it is missing
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def _compile_directory(directory, cached):
+    """
+        Get the parsed data of every device file in a directory, reusing
+        cached data for files that have not changed. The directory is only
+        listed again when its modification time changed, i.e. when files
+        were added, removed or renamed.
+        
+        @type directory: str
+        @param directory: The path to the device presets
+        @type cached: dict
+        @param cached: The cached entry for this directory or None
+        @rtype: tuple
+        @return: The new cache entry and whether it differs from the old one
+    """
+    mtime = _get_mtime(directory)
+    
+    if cached and cached["mtime"] == mtime:
+        filenames = cached["files"].keys()
+    else:
+        filenames = [x for x in os.listdir(directory) if x.endswith("json")]
+        cached = cached or {"mtime": None, "files": {}}
+    
+    entry = {
+        "mtime": mtime,
+        "files": {},
+    }
+    changed = mtime != cached["mtime"]
+    
+    for filename in filenames:
+        path = os.path.join(directory, filename)
+        file_mtime = _get_mtime(path)
+        if file_mtime is None:
+            changed = True
+            continue
+        
+        old = cached["files"].get(filename)
+        if old and old[0] == file_mtime:
+            entry["files"][filename] = old
+            continue
+        
+        changed = True
+        try:
+            data = json.loads(open(path).read())
+        except Exception, e:
+            # Remember broken files so they are retried once they change
+            _log.warning("Problem loading %s! %s" % (filename, str(e)))
+            data = None
+        
+        entry["files"][filename] = (file_mtime, data)
+    
+    return entry, changed
+
 def load_directory(directory):
     """
-        Load an entire directory of device presets.
+        Load an entire directory of device presets. Devices are only built
+        when they are first accessed, see DeviceIndex.
         
         @type directory: str
         @param directory: The path to load
         @rtype: dict
         @return: A dictionary of all the loaded devices
     """
-    global _presets
-    for filename in os.listdir(directory):
-        if filename.endswith("json"):
-            try:
-                _presets[filename[:-5]] = load(os.path.join(directory, filename))
-            except Exception, e:
-                _log.warning("Problem loading %s! %s" % (filename, str(e)))
-    return _presets
+    presets = get()
+    
+    directory = os.path.abspath(directory)
+    directories = _load_cache()
+    
+    entry, changed = _compile_directory(directory, directories.get(directory))
+    if changed:
+        directories[directory] = entry
+        _save_cache(directories)
+    
+    for filename, (mtime, data) in entry["files"].items():
+        if data is not None:
+            presets.add(filename[:-5], os.path.join(directory, filename), data)
+    
+    return presets
 
 def get():
     """
-        Get all loaded device presets.
+        Get all loaded device presets. The presets are loaded the first time
+        this is called.
         
         @rtype: dict
         @return: A dictionary of Device objects where the keys are the short
                  name for the device
     """
+    if _presets is None:
+        reset()
+    
     return _presets
 
+def get_available_elements():
+    """
+        Get the names of all elements in the GStreamer registry. The set is
+        built once and rebuilt only after reset_available_elements() was
+        called. The registry's plugin-added and feature-added signals are
+        not used as they fire all the time while plugins are loaded lazily.
+        
+        @rtype: set
+        @return: The names of all available elements
+    """
+    global _elements
+    
+    if _elements is None:
+        import gst
+        
+        registry = gst.registry_get_default()
+        elements = set([x.get_name() for x in \
+                        registry.get_feature_list(gst.ElementFactory)])
+        
+        _log.debug(_("Found %(count)d available elements") % {
+            "count": len(elements),
+        })
+        
+        _elements = elements
+    
+    return _elements
+
+def reset_available_elements(*args):
+    """
+        Forget the available elements so they are looked up again on next
+        use. Call this after updating the registry, e.g. once plugins were
+        installed.
+    """
+    global _elements
+    
+    _elements = None
+
+def get_availability():
+    """
+        Find out which presets can be used to encode with the installed
+        GStreamer elements.
+        
+        @rtype: dict
+        @return: A dictionary of device short names to dictionaries of
+                 preset names to lists of missing elements, which are empty
+                 for usable presets
+    """
+    availability = {}
+    
+    for name, device in get().items():
+        availability[name] = {}
+        for preset in device.presets.values():
+            availability[name][preset.name] = preset.missing_elements
+    
+    return availability
+
 def version_info():
     """
         Generate a string of version information. Each line contains 
@@ -556,33 +973,174 @@ def version_info():
         This is used for checking for updates.
     """
     info = ""
+    devices = get()
     
-    for name, device in _presets.items():
-        info += "%s, %s\n" % (name, device.version)
+    for name in devices.keys():
+        info += "%s, %s\n" % (name, devices.get_version(name))
         
     return info
 
+def _get_local_path():
+    """
+        @rtype: str
+        @return: The user's local presets directory, which is created if it
+                 doesn't exist yet
+    """
+    local_path = os.path.expanduser(os.path.join("~", ".arista", "presets"))
+    
+    if not os.path.exists(local_path):
+        try:
+            os.makedirs(local_path)
+        except OSError:
+            # Created by another thread in the meantime
+            if not os.path.isdir(local_path):
+                raise
+    
+    return local_path
+
+def _parse_manifest(data):
+    """
+        @rtype: dict
+        @return: A dictionary of member names to their SHA-256 digests
+    """
+    manifest = {}
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        
+        try:
+            digest, name = line.split(None, 1)
+        except ValueError:
+            raise PresetArchiveException(_("Invalid manifest line: " \
+                                           "%(line)s") % {
+                "line": line,
+            })
+        
+        # sha256sum marks binary mode with a leading *
+        manifest[name.lstrip("*")] = digest.lower()
+    
+    return manifest
+
+def _get_member_name(member):
+    """
+        Get a safe file name for an archive member. Preset archives are flat,
+        so only plain files without a directory part are allowed.
+        
+        @type member: tarfile.TarInfo
+        @param member: The archive member
+        @rtype: str
+        @return: The file name or None for directories that are skipped
+        @raise PresetArchiveException: The member is not a safe plain file
+    """
+    name = os.path.normpath(member.name)
+    
+    if member.isdir():
+        if name in [".", ""]:
+            return None
+        raise PresetArchiveException(_("Unexpected directory %(name)s in " \
+                                       "preset archive!") % {
+            "name": member.name,
+        })
+    
+    if not member.isfile() or os.path.isabs(name) or os.sep in name or \
+       (os.altsep and os.altsep in name) or name.startswith("."):
+        raise PresetArchiveException(_("Unsafe file %(name)s in preset " \
+                                       "archive!") % {
+            "name": member.name,
+        })
+    
+    return name
+
+def _check_digest(manifest, name, digest):
+    if name not in manifest:
+        raise PresetArchiveException(_("%(name)s is not listed in the " \
+                                       "preset archive manifest!") % {
+            "name": name,
+        })
+    
+    if manifest[name] != digest:
+        raise PresetArchiveException(_("Checksum mismatch for %(name)s!") % {
+            "name": name,
+        })
+
 def extract(stream):
     """
-        Extract a preset file into the user's local presets directory.
+        Extract a preset file into the user's local presets directory. The
+        archive is read as a stream, one block at a time, so memory use does
+        not depend on its size. Every member is written to a temporary
+        directory while its SHA-256 digest is computed and checked against
+        the archive's manifest, if it has one. Files are only moved into
+        place once the whole archive has been verified.
         
         @type stream: a file-like object
         @param stream: The opened bzip2-compressed tar file of the preset
         @rtype: list
         @return: The installed device preset shortnames ["name1", "name2", ...]
+        @raise PresetArchiveException: The archive is invalid
     """
-    local_path = os.path.expanduser(os.path.join("~", ".arista", "presets"))
+    local_path = _get_local_path()
     
-    if not os.path.exists(local_path):
-        os.makedirs(local_path)
-        
     tar = tarfile.open(mode="r|bz2", fileobj=stream)
     _log.debug(_("Extracting %(filename)s") % {
         "filename": hasattr(stream, "name") and stream.name or "data stream",
     })
-    tar.extractall(path=local_path)
     
-    return [x[:-5] for x in tar.getnames() if x.endswith(".json")]
+    temp = tempfile.mkdtemp(prefix=".install-", dir=local_path)
+    try:
+        manifest = None
+        digests = {}
+        
+        for member in tar:
+            name = _get_member_name(member)
+            if name is None:
+                continue
+            
+            if name in digests or (name == MANIFEST_NAME and manifest):
+                raise PresetArchiveException(_("Duplicate file %(name)s in " \
+                                               "preset archive!") % {
+                    "name": name,
+                })
+            
+            if name == MANIFEST_NAME:
+                manifest = _parse_manifest(tar.extractfile(member).read())
+                
+                # Check anything that came before the manifest
+                for previous, digest in digests.items():
+                    _check_digest(manifest, previous, digest)
+                continue
+            
+            output = open(os.path.join(temp, name), "wb")
+            try:
+                digests[name] = _copy(tar.extractfile(member), output)
+            finally:
+                output.close()
+            
+            if manifest is not None:
+                _check_digest(manifest, name, digests[name])
+        
+        if manifest is None:
+            _log.debug(_("Preset archive has no manifest, not verifying it"))
+        else:
+            for name in manifest:
+                if name not in digests:
+                    raise PresetArchiveException(_("%(name)s is missing " \
+                                                   "from preset archive!") % {
+                        "name": name,
+                    })
+        
+        # Move the device JSON files last so that a loaded device never
+        # refers to an icon that isn't there yet
+        filenames = sorted(digests.keys(), key=lambda x: x.endswith(".json"))
+        for filename in filenames:
+            os.rename(os.path.join(temp, filename),
+                      os.path.join(local_path, filename))
+        
+        utils.refresh_paths()
+    finally:
+        tar.close()
+        shutil.rmtree(temp, ignore_errors=True)
+    
+    return [x[:-5] for x in filenames if x.endswith(".json")]
 
 def fetch(location, name):
     """
@@ -618,11 +1176,308 @@ def fetch(location, name):
     
     return updated
 
+class _Connection(object):
+    """
+        A persistent HTTP connection to a preset repository that is reused
+        for every request a worker makes.
+    """
+    def __init__(self, location):
+        """
+            @type location: str
+            @param location: The base URL of the repository, ending in "/"
+        """
+        scheme, self.host, self.path, query, fragment = \
+            urlparse.urlsplit(location)
+        
+        if scheme == "https":
+            self.connection_class = httplib.HTTPSConnection
+        elif scheme == "http":
+            self.connection_class = httplib.HTTPConnection
+        else:
+            raise ValueError(_("Unsupported preset location %(location)s!") % {
+                "location": location,
+            })
+        
+        self.connection = None
+    
+    def get(self, name, validators):
+        """
+            Send a conditional GET request. The response must be read
+            completely before the next request is sent.
+            
+            @type name: str
+            @param name: The file to request, relative to the location
+            @type validators: dict
+            @param validators: The "etag" and "last-modified" values of a
+                               previous response, if any
+            @rtype: httplib.HTTPResponse
+            @return: The response
+        """
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last-modified"):
+            headers["If-Modified-Since"] = validators["last-modified"]
+        
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self.connection_class(self.host,
+                                                        timeout=UPDATE_TIMEOUT)
+            
+            try:
+                self.connection.request("GET", self.path + name,
+                                        headers=headers)
+                return self.connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                # The server may have closed an idle connection, so retry
+                # once with a new one
+                self.close()
+                if attempt:
+                    raise
+    
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+def _get_validators(response):
+    """
+        @rtype: dict
+        @return: The validators of a response to send with the next request
+    """
+    return {
+        "etag": response.getheader("etag"),
+        "last-modified": response.getheader("last-modified"),
+    }
+
+def _load_validators():
+    """
+        @rtype: dict
+        @return: A dictionary of URLs to the validators of their last
+                 successful download
+    """
+    path = utils.get_write_path("cache", "preset-updates.json", default="")
+    if not path or not os.path.exists(path):
+        return {}
+    
+    try:
+        return json.loads(open(path).read())
+    except ValueError:
+        return {}
+
+def _save_validators(validators):
+    path = utils.get_write_path("cache", "preset-updates.json", default="")
+    if not path:
+        return
+    
+    try:
+        open(path + ".tmp", "w").write(json.dumps(validators, indent=4))
+        os.rename(path + ".tmp", path)
+    except (IOError, OSError), e:
+        _log.warning(_("Unable to save preset update state: %(error)s") % {
+            "error": str(e),
+        })
+
+def _parse_version(version):
+    """
+        @rtype: list
+        @return: A version string as a list that compares correctly, e.g.
+                 "1.10" is newer than "1.9"
+    """
+    parts = []
+    for part in str(version).split("."):
+        try:
+            parts.append((int(part), ""))
+        except ValueError:
+            parts.append((-1, part))
+    
+    return parts
+
+def _download(connection, name):
+    """
+        Download and install a preset archive. Archives are only requested
+        when the manifest lists a newer version than the installed one, so
+        the request is never conditional.
+        
+        @rtype: list
+        @return: The installed device preset shortnames
+    """
+    response = connection.get(name + ".tar.bz2", {})
+    
+    if response.status != 200:
+        response.read()
+        raise IOError(_("Server returned %(status)d %(reason)s") % {
+            "status": response.status,
+            "reason": response.reason,
+        })
+    
+    # Download completely before installing anything so that a broken
+    # connection can't leave a half installed preset behind
+    temp = tempfile.TemporaryFile()
+    try:
+        while True:
+            data = response.read(CHUNK_SIZE)
+            if not data:
+                break
+            temp.write(data)
+        
+        temp.seek(0)
+        installed = extract(temp)
+    finally:
+        temp.close()
+    
+    return installed
+
+def _update_worker(location, pending, results, lock):
+    """
+        Download presets from the pending list until it is empty, reusing a
+        single connection.
+    """
+    connection = _Connection(location)
+    
+    try:
+        while True:
+            lock.acquire()
+            try:
+                if not pending:
+                    break
+                name = pending.pop(0)
+                url = location + name + ".tar.bz2"
+            finally:
+                lock.release()
+            
+            _log.debug(_("Fetching %(location)s") % {
+                "location": url,
+            })
+            
+            try:
+                installed = _download(connection, name)
+            except Exception, e:
+                connection.close()
+                _log.warning(_("There was an error fetching and installing " \
+                               "%(location)s: %(error)s") % {
+                    "location": url,
+                    "error": str(e),
+                })
+                continue
+            
+            lock.acquire()
+            try:
+                results += installed
+            finally:
+                lock.release()
+    finally:
+        connection.close()
+
+def update(location, names=None, concurrency=4):
+    """
+        Update installed presets from a preset repository. The repository
+        must provide a manifest.json with a dictionary of preset names to
+        their versions and a name.tar.bz2 archive for each preset. Only
+        presets that are newer than the installed version are downloaded,
+        several at once. The manifest is kept in the cache and only
+        downloaded again when it was modified. Any HTTP server that
+        supports ETag or If-Modified-Since works as a repository.
+        
+        @type location: str
+        @param location: The base URL of the preset repository
+        @type names: list
+        @param names: The device preset shortnames to update, defaults to
+                      all installed presets
+        @type concurrency: int
+        @param concurrency: The maximum number of concurrent downloads
+        @rtype: list
+        @return: The installed device preset shortnames ["name1", "name2", ...]
+    """
+    if not location.endswith("/"):
+        location = location + "/"
+    
+    devices = get()
+    if names is None:
+        names = devices.keys()
+    
+    validators = _load_validators()
+    manifest_url = location + "manifest.json"
+    cached = validators.get(manifest_url, {})
+    if cached.get("manifest") is None:
+        # Without the manifest itself the validators are useless
+        cached = {}
+    
+    connection = _Connection(location)
+    try:
+        response = connection.get("manifest.json", cached)
+        body = response.read()
+    finally:
+        connection.close()
+    
+    if response.status == 304:
+        # The manifest hasn't changed, but the local presets may have been
+        # reset or removed since, so still compare versions
+        _log.debug(_("Preset manifest not modified"))
+        remote = cached["manifest"]
+    elif response.status != 200:
+        raise IOError(_("Unable to fetch %(location)s: %(status)d " \
+                        "%(reason)s") % {
+            "location": manifest_url,
+            "status": response.status,
+            "reason": response.reason,
+        })
+    else:
+        remote = json.loads(body)
+        cached = _get_validators(response)
+        cached["manifest"] = remote
+    
+    validators[manifest_url] = cached
+    
+    pending = []
+    for name in names:
+        if name not in remote:
+            continue
+        
+        if name not in devices or \
+           _parse_version(remote[name]) > \
+           _parse_version(devices.get_version(name)):
+            pending.append(name)
+    
+    _log.debug(_("Updating %(count)d of %(total)d presets") % {
+        "count": len(pending),
+        "total": len(names),
+    })
+    
+    results = []
+    lock = threading.Lock()
+    workers = []
+    for x in range(min(concurrency, len(pending))):
+        worker = threading.Thread(target=_update_worker,
+                                  args=(location, pending, results, lock))
+        worker.setDaemon(True)
+        worker.start()
+        workers.append(worker)
+    
+    for worker in workers:
+        worker.join()
+    
+    _save_validators(validators)
+    
+    if results:
+        load_directory(_get_local_path())
+    
+    return results
+
 def reset(overwrite=False, ignore_initial=False):
-    # Automatically load presets
+    """
+        Load the device presets, populating the user's presets directory
+        from the installed presets first if that hasn't been done yet.
+        
+        @type overwrite: bool
+        @param overwrite: Overwrite existing user presets with installed ones
+        @type ignore_initial: bool
+        @param ignore_initial: Copy installed presets even if this has been
+                               done before
+    """
     global _presets
     
-    _presets = {}
+    _presets = DeviceIndex()
     
     load_path = utils.get_write_path("presets")
     if ignore_initial or not os.path.exists(os.path.join(load_path, ".initial_complete")):
@@ -646,8 +1501,7 @@ def reset(overwrite=False, ignore_initial=False):
                     # Do not overwrite existing files
                     if overwrite or not os.path.exists(os.path.join(load_path, f)):
                         shutil.copy2(os.path.join(full, f), load_path)
+        
+        utils.refresh_paths()
     
     load_directory(load_path)
-
-reset()
-
@@ -4,7 +4,7 @@
     Arista Queue Handling
     =====================
     A set of tools to handle creating a queue of transcodes and running them
-    one after the other.
+    one after the other, or several at once.
     
     License
     -------
@@ -76,7 +76,8 @@ class TranscodeQueue(gobject.GObject):
         A generic queue for transcoding. This object acts as a list of 
         QueueEntry items with a couple convenience methods. A timeout in the
         gobject main loop continuously checks for new entries and starts
-        them as needed.
+        them as needed. Entries stay in the queue while they are being
+        processed.
     """
     
     __gsignals__ = {
@@ -97,21 +98,39 @@ class TranscodeQueue(gobject.GObject):
                           (gobject.TYPE_PYOBJECT,)),   # QueueEntry
     }
     
-    def __init__(self, check_interval = 500):
+    def __init__(self, check_interval = 500, concurrency = 1):
         """
             Create a new queue, setup locks, and register a callback.
             
             @type check_interval: int
             @param check_interval: The interval in milliseconds between
                                    checking for new queue items
+            @type concurrency: int
+            @param concurrency: The number of entries to process at once
         """
         self.__gobject_init__()
         self._queue = []
+        self._running = []
+        self.concurrency = max(1, concurrency)
         self.running = True
-        self.pipe_running = False
         self.enc_pass = 0
         gobject.timeout_add(check_interval, self._check_queue)
     
+    @property
+    def pipe_running(self):
+        """
+            Whether any entry is being processed.
+        """
+        return len(self._running) > 0
+    
+    @property
+    def running_entries(self):
+        """
+            The entries that are being processed, in the order they were
+            started.
+        """
+        return list(self._running)
+    
     def __getitem__(self, index):
         """
             Safely get an item from the queue.
@@ -129,8 +148,8 @@ class TranscodeQueue(gobject.GObject):
         """
             Safely delete an item from the queue.
         """
-        if index == 0 and self.pipe_running:
-            self.pipe_running = False
+        if self._queue[index] in self._running:
+            self._running.remove(self._queue[index])
         
         del self._queue[index]
     
@@ -167,54 +186,75 @@ class TranscodeQueue(gobject.GObject):
         """
             Remove a QueueEntry from the queue.
         """
+        if entry in self._running:
+            self._running.remove(entry)
+        
         self._queue.remove(entry)
     
     def _check_queue(self):
         """
             This method is invoked periodically by the gobject mainloop.
-            It watches the queue and when items are added it will call
-            the callback and watch over the pipe until it completes, then loop
-            for each item so that each encode is executed after the previous
-            has finished.
-        """
-        item = None
-        if len(self._queue) and not self.pipe_running:
-            item = self._queue[0]
-        if item:
-            _log.debug(_("Found item in queue! Queue is %(queue)s" % {
-                "queue": str(self)
-            }))
-            item.transcoder =  Transcoder(item.options)
-            item.transcoder.connect("complete", self._on_complete)
-            
-            def discovered(transcoder, info, is_media):
-                self.emit("entry-discovered", item, info, is_media)
-                if not is_media:
-                    self.emit("entry-error", item, _("Not a recognized media file!"))
-                    self._queue.pop(0)
-                    self.pipe_running = False
-            
-            def pass_setup(transcoder):
-                self.emit("entry-pass-setup", item)
-                if transcoder.enc_pass == 0:
-                    self.emit("entry-start", item)
-            
-            def error(transcoder, errorstr):
-                self.emit("entry-error", item, errorstr)
-                self._queue.pop(0)
-                self.pipe_running = False
+            It watches the queue and starts the first entries that aren't
+            being processed yet, until as many entries as the concurrency
+            allows are running.
+        """
+        for item in self._queue[:]:
+            if len(self._running) >= self.concurrency:
+                break
             
-            item.transcoder.connect("discovered", discovered)
-            item.transcoder.connect("pass-setup", pass_setup)
-            item.transcoder.connect("error", error)
-            self.pipe_running = True
+            if item not in self._running:
+                _log.debug(_("Found item in queue! Queue is %(queue)s" % {
+                    "queue": str(self)
+                }))
+                self._start_entry(item)
+        
         return True
     
-    def _on_complete(self, transcoder):
+    def _start_entry(self, item):
+        """
+            Start processing a queue entry.
+        """
+        item.transcoder =  Transcoder(item.options)
+        item.transcoder.connect("complete", self._on_complete, item)
+        
+        def discovered(transcoder, info, is_media):
+            self.emit("entry-discovered", item, info, is_media)
+            if not is_media:
+                self.emit("entry-error", item, _("Not a recognized media file!"))
+                self._finish_entry(item)
+        
+        # Checkpointed encodes set up the first pass again for every
+        # segment, but the entry only starts once
+        started = []
+        
+        def pass_setup(transcoder):
+            self.emit("entry-pass-setup", item)
+            if not started:
+                started.append(True)
+                self.emit("entry-start", item)
+        
+        def error(transcoder, errorstr):
+            self.emit("entry-error", item, errorstr)
+            self._finish_entry(item)
+        
+        item.transcoder.connect("discovered", discovered)
+        item.transcoder.connect("pass-setup", pass_setup)
+        item.transcoder.connect("error", error)
+        self._running.append(item)
+    
+    def _finish_entry(self, item):
+        """
+            Remove a processed entry so the next one can be started.
+        """
+        if item in self._running:
+            self._running.remove(item)
+        
+        if item in self._queue:
+            self._queue.remove(item)
+    
+    def _on_complete(self, transcoder, item):
         """
             An entry is complete!
         """
-        self.emit("entry-complete", self._queue[0])
-        self._queue.pop(0)
-        self.pipe_running = False
-
+        self.emit("entry-complete", item)
+        self._finish_entry(item)
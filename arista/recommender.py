@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+"""
+    Arista Preset Recommender
+    =========================
+    Pick a preset for a file with a simple cost model. The output size and
+    frame rate each preset would produce are worked out from its limits the
+    same way the transcoder does, then encode time and output size are
+    estimated from the recorded encode history or, for presets without
+    history, from the number of pixels to encode.
+
+    Example Use
+    -----------
+    Get recommendations for a discovered file, best first:
+
+        >>> info = arista.discoverer.probe("movie.avi")
+        >>> device = arista.presets.get()["apple"]
+        >>> results = arista.recommender.recommend(info,
+        ...                                       device.presets.values(),
+        ...                                       max_time=600)
+        >>> results[0].preset
+        iPhone / iPod Touch qtmux
+
+    License
+    -------
+    Copyright 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import gettext
+import logging
+
+import history
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.recommender")
+
+# Relative cost per pixel of a single pass of common video encoders, where
+# x264enc is 1.0. Unknown encoders use DEFAULT_ENCODER_COST.
+ENCODER_COST = {
+    "x264enc": 1.0,
+    "vp8enc": 1.5,
+    "theoraenc": 0.6,
+    "xvidenc": 0.5,
+    "ffenc_mpeg4": 0.3,
+    "ffenc_mpeg2video": 0.3,
+    "ffenc_flv": 0.3,
+    "ffenc_wmv2": 0.3,
+}
+DEFAULT_ENCODER_COST = 1.0
+
+# Pixels per second an encoder with a cost of 1.0 encodes in one pass on a
+# typical machine, only used for presets without encode history
+PIXEL_RATE = 25000000.0
+
+# Rough output bitrates used for presets without encode history
+BITS_PER_PIXEL = 0.1
+AUDIO_BITRATE = 128000
+
+class Recommendation(object):
+    """
+        A preset with the estimated cost of encoding a file with it.
+    """
+    def __init__(self, preset, width, height, framerate, time, size,
+                 measured, acceptable):
+        """
+            @type preset: arista.presets.Preset
+            @param preset: The preset
+            @type width: int
+            @param width: The output video width or 0 for audio only
+            @type height: int
+            @param height: The output video height or 0 for audio only
+            @type framerate: float
+            @param framerate: The output frame rate or 0 for audio only
+            @type time: float
+            @param time: The estimated encode time in seconds
+            @type size: int
+            @param size: The estimated output size in bytes
+            @type measured: bool
+            @param measured: Whether the estimates are based on recorded
+                             encode history
+            @type acceptable: bool
+            @param acceptable: Whether the estimates meet the constraints
+        """
+        self.preset = preset
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.time = time
+        self.size = size
+        self.measured = measured
+        self.acceptable = acceptable
+        
+        # Output pixels per second that carry source detail, i.e. without
+        # any upscaling, used as a measure of quality
+        self.quality = 0.0
+    
+    def __repr__(self):
+        return "<Recommendation %s %dx%d %.0fs %d bytes>" % (self.preset.name,
+                                                            self.width,
+                                                            self.height,
+                                                            self.time,
+                                                            self.size)
+
+def get_output_format(preset, info):
+    """
+        Get the video size and frame rate a preset would produce for a file.
+        This follows the scaling done by the transcoder, ignoring cropping
+        and pixel aspect ratio.
+        
+        @type preset: arista.presets.Preset
+        @param preset: The preset
+        @type info: arista.discoverer.MediaInfo
+        @param info: The discovered file
+        @rtype: tuple
+        @return: The output width, height and frame rate, which are all zero
+                 if there is no video
+    """
+    if not info.is_video or not preset.vcodec.name or \
+       not info.videowidth or not info.videoheight:
+        return 0, 0, 0.0
+    
+    wmin, wmax = preset.vcodec.width
+    hmin, hmax = preset.vcodec.height
+    owidth, oheight = info.videowidth, info.videoheight
+    width, height = owidth, oheight
+    
+    if owidth < wmin:
+        width = wmin
+        height = int((float(wmin) / owidth) * oheight)
+    elif owidth > wmax:
+        width = wmax
+        height = int((float(wmax) / owidth) * oheight)
+    
+    if height < hmin:
+        height = hmin
+        width = int((float(hmin) / oheight) * owidth)
+    elif height > hmax:
+        height = hmax
+        width = int((float(hmax) / oheight) * owidth)
+    
+    rmin = float(preset.vcodec.rate[0])
+    rmax = float(preset.vcodec.rate[1])
+    rate = info.videorate.num / float(info.videorate.denom or 1)
+    
+    return width, height, min(max(rate, rmin), rmax)
+
+def estimate(preset, info):
+    """
+        Estimate the encode time and output size of a file.
+        
+        @type preset: arista.presets.Preset
+        @param preset: The preset
+        @type info: arista.discoverer.MediaInfo
+        @param info: The discovered file
+        @rtype: Recommendation
+        @return: The estimates, which are acceptable until checked against
+                 constraints
+    """
+    width, height, framerate = get_output_format(preset, info)
+    duration = info.length / 1000000000.0
+    
+    time, size = history.estimate(preset, duration)
+    measured = time is not None
+    
+    if not measured:
+        pixels = width * height * framerate * duration
+        passes = max(1, len(preset.vcodec.passes))
+        cost = ENCODER_COST.get(preset.vcodec.name, DEFAULT_ENCODER_COST)
+        
+        # Even audio only encodes take some time
+        time = max(pixels * passes * cost / PIXEL_RATE, duration / 100.0)
+        
+        bits = pixels * BITS_PER_PIXEL
+        if info.is_audio and preset.acodec.name:
+            bits += duration * AUDIO_BITRATE
+        size = int(bits / 8)
+    
+    result = Recommendation(preset, width, height, framerate, time, size,
+                            measured, True)
+    
+    if width:
+        rate = info.videorate.num / float(info.videorate.denom or 1)
+        result.quality = min(width * height,
+                             info.videowidth * info.videoheight) * \
+                         min(framerate, rate or framerate)
+    
+    return result
+
+def recommend(info, presets, max_time=None, max_size=None):
+    """
+        Rank presets for encoding a file. Presets that meet the constraints
+        come first, those that keep the most of the source resolution and
+        frame rate ahead of the others and the cheapest of them first.
+        Presets that don't meet the constraints follow, cheapest first.
+        
+        @type info: arista.discoverer.MediaInfo
+        @param info: The discovered file
+        @type presets: list
+        @param presets: The presets to choose from, e.g. those of a device
+        @type max_time: float
+        @param max_time: The maximum encode time in seconds
+        @type max_size: int
+        @param max_size: The maximum output size in bytes
+        @rtype: list
+        @return: A list of Recommendation objects, best first
+    """
+    results = []
+    for preset in presets:
+        result = estimate(preset, info)
+        
+        if max_time is not None and result.time > max_time:
+            result.acceptable = False
+        if max_size is not None and result.size > max_size:
+            result.acceptable = False
+        
+        _log.debug(_("%(preset)s: %(width)dx%(height)d, %(time).1fs, " \
+                     "%(size)d bytes%(measured)s") % {
+            "preset": preset.name,
+            "width": result.width,
+            "height": result.height,
+            "time": result.time,
+            "size": result.size,
+            "measured": result.measured and _(" (measured)") or "",
+        })
+        
+        results.append(result)
+    
+    def _key(result):
+        if result.acceptable:
+            return (0, -result.quality, result.time)
+        else:
+            return (1, result.time, 0)
+    
+    results.sort(key=_key)
+    
+    return results
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+"""
+    Arista Preset Registry
+    ======================
+    Indexes of all device presets by device, slug, container, codecs and
+    extension so that presets can be looked up and filtered without walking
+    every device.
+
+    Example Use
+    -----------
+    Look up presets through the shared registry:
+
+        >>> registry = arista.registry.get()
+        >>> registry.find("computer", "H.2")
+        H.264 mp4mux
+        >>> registry.query(container="webmmux")
+        [WebM webmmux]
+        >>> registry.prefix("apple-")
+        [iPad qtmux, iPhone / iPod Touch qtmux, ...]
+
+    License
+    -------
+    Copyright 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import gettext
+import logging
+
+import presets
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.registry")
+
+_registry = None
+
+class PresetRegistry(object):
+    """
+        Secondary indexes over a dictionary of devices. Looking up presets
+        of a single device only builds that device, the other indexes are
+        built for all devices the first time they are needed.
+    """
+    def __init__(self, devices):
+        """
+            @type devices: arista.presets.DeviceIndex
+            @param devices: The devices to index
+        """
+        self.devices = devices
+        self.generation = devices.generation
+        
+        self._names = {}
+        self._indexed = False
+    
+    def _get_names(self, device):
+        """
+            @rtype: list
+            @return: The sorted preset names of a device
+        """
+        if device not in self._names:
+            self._names[device] = sorted(self.devices[device].presets.keys())
+        
+        return self._names[device]
+    
+    def _build(self):
+        """
+            Build the indexes of all presets.
+        """
+        if self._indexed:
+            return
+        
+        self._by_slug = {}
+        self._slugs = []
+        self._fields = {
+            "device": {},
+            "container": {},
+            "vcodec": {},
+            "acodec": {},
+            "extension": {},
+        }
+        self._search = []
+        self._sorted = []
+        
+        for name, device in self.devices.items():
+            self._sorted.append((device.name.lower(), name))
+            
+            for preset in device.presets.values():
+                slug = preset.slug
+                self._by_slug[slug] = preset
+                
+                for field, value in [("device", name),
+                                     ("container", preset.container),
+                                     ("vcodec", preset.vcodec.name),
+                                     ("acodec", preset.acodec.name),
+                                     ("extension", preset.extension)]:
+                    self._fields[field].setdefault(value, []).append(preset)
+                
+                # Everything the preset can be searched by in one string
+                text = "\0".join([device.name, device.description or "",
+                                  preset.name, preset.vcodec.name,
+                                  preset.acodec.name])
+                self._search.append((text.lower(), preset))
+        
+        self._slugs = sorted(self._by_slug.keys())
+        self._sorted.sort()
+        self._indexed = True
+        
+        _log.debug(_("Indexed %(count)d presets") % {
+            "count": len(self._slugs),
+        })
+    
+    def sorted_devices(self):
+        """
+            @rtype: list
+            @return: A list of (short name, device) tuples sorted by the
+                     device name
+        """
+        self._build()
+        
+        return [(name, self.devices[name]) for (key, name) in self._sorted]
+    
+    def find(self, device, preset=None):
+        """
+            Find a preset of a device by its name or the start of its name.
+            
+            @type device: str
+            @param device: The device short name
+            @type preset: str
+            @param preset: The preset name or a prefix of it; if not given
+                           the default preset of the device is returned
+            @rtype: Preset
+            @return: The preset or None if it is not found
+        """
+        if device not in self.devices:
+            return None
+        
+        presets = self.devices[device].presets
+        
+        if not preset:
+            try:
+                return self.devices[device].default_preset
+            except ValueError:
+                return None
+        
+        if preset in presets:
+            return presets[preset]
+        
+        names = self._get_names(device)
+        pos = bisect.bisect_left(names, preset)
+        if pos < len(names) and names[pos].startswith(preset):
+            return presets[names[pos]]
+        
+        return None
+    
+    def get_slug(self, slug):
+        """
+            @type slug: str
+            @param slug: A preset slug, e.g. computer-webm
+            @rtype: Preset
+            @return: The preset or None if it is not found
+        """
+        self._build()
+        
+        return self._by_slug.get(slug)
+    
+    def prefix(self, prefix):
+        """
+            Find all presets whose slug starts with a prefix.
+            
+            @type prefix: str
+            @param prefix: The start of the slug, e.g. "apple-" for all Apple
+                           presets
+            @rtype: list
+            @return: The matching presets sorted by slug
+        """
+        self._build()
+        
+        results = []
+        pos = bisect.bisect_left(self._slugs, prefix)
+        while pos < len(self._slugs) and self._slugs[pos].startswith(prefix):
+            results.append(self._by_slug[self._slugs[pos]])
+            pos += 1
+        
+        return results
+    
+    def query(self, **kwargs):
+        """
+            Find all presets matching every given field exactly.
+            
+                >>> registry.query(container="qtmux", acodec="faac")
+            
+            @type device: str
+            @param device: The device short name
+            @type container: str
+            @param container: The container element name
+            @type vcodec: str
+            @param vcodec: The video encoder element name
+            @type acodec: str
+            @param acodec: The audio encoder element name
+            @type extension: str
+            @param extension: The output file extension
+            @rtype: list
+            @return: The matching presets
+            @raise ValueError: An unknown field was given
+        """
+        self._build()
+        
+        results = None
+        for field, value in kwargs.items():
+            if field not in self._fields:
+                raise ValueError(_("Cannot query presets by %(field)s!") % {
+                    "field": field,
+                })
+            
+            matches = self._fields[field].get(value, [])
+            if results is None:
+                results = matches
+            else:
+                ids = set([id(x) for x in matches])
+                results = [x for x in results if id(x) in ids]
+        
+        if results is None:
+            results = [x for (text, x) in self._search]
+        
+        return list(results)
+    
+    def search(self, text):
+        """
+            Find all presets whose device name, description, preset name or
+            codecs contain some text, ignoring case.
+            
+            @type text: str
+            @param text: The text to search for
+            @rtype: list
+            @return: The matching presets
+        """
+        self._build()
+        
+        text = text.lower().strip()
+        
+        return [preset for (haystack, preset) in self._search \
+                if text in haystack]
+
+def get():
+    """
+        Get the shared preset registry. It is rebuilt when devices were added
+        to or removed from arista.presets.get() or after reset() was called.
+        
+        @rtype: PresetRegistry
+        @return: The registry of all loaded presets
+    """
+    global _registry
+    
+    devices = presets.get()
+    
+    if _registry is None or _registry.devices is not devices or \
+       _registry.generation != devices.generation:
+        _registry = PresetRegistry(devices)
+    
+    return _registry
+
+def reset():
+    """
+        Drop the shared registry so it is rebuilt on next use. Call this
+        after changing presets in place, e.g. renaming them.
+    """
+    global _registry
+    
+    _registry = None
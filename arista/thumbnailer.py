@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+"""
+    Arista Thumbnailer
+    ==================
+    Generate poster frames and contact sheets from media files by seeking to
+    evenly spaced keyframes rather than decoding the entire file.
+
+    Example Use
+    -----------
+    Discover a file first, then pass the info to the thumbnailer:
+
+        >>> def discovered(info, is_media):
+        ...     thumbs = arista.thumbnailer.Thumbnailer(info, "out/movie")
+        ...     thumbs.connect("complete", done)
+        ...     thumbs.start()
+
+    License
+    -------
+    Copyright 2011 Daniel G. Taylor <dan@programmer-art.org>
+
+    This file is part of Arista.
+
+    Arista is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as
+    published by the Free Software Foundation, either version 2.1 of
+    the License, or (at your option) any later version.
+
+    Arista is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public
+    License along with Arista.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+import gettext
+import logging
+import os
+
+import gobject
+import gst
+
+_ = gettext.gettext
+_log = logging.getLogger("arista.thumbnailer")
+
+# Only decode video in the playbin2 used to grab frames, see the
+# GstPlayFlags enum in playbin2
+PLAY_FLAG_VIDEO = 0x1
+
+class ThumbnailerException(Exception):
+    """
+        An exception to be thrown when thumbnails cannot be generated.
+    """
+    pass
+
+class _FrameGrabber(object):
+    """
+        A single paused pipeline that seeks to keyframes and grabs the
+        prerolled frame for each position it is handed.
+    """
+    def __init__(self, thumbnailer, uri, width, height):
+        self.thumbnailer = thumbnailer
+        self.position = None
+        self.seeking = False
+
+        sink = gst.parse_bin_from_description(
+            "ffmpegcolorspace ! videoscale ! " \
+            "video/x-raw-rgb,width=%(width)d,height=%(height)d," \
+            "pixel-aspect-ratio=1/1 ! gdkpixbufsink name=pixbufsink" % {
+                "width": width,
+                "height": height,
+            }, True)
+
+        self.pipe = gst.element_factory_make("playbin2")
+        self.pipe.set_property("uri", uri)
+        self.pipe.set_property("flags", PLAY_FLAG_VIDEO)
+        self.pipe.set_property("audio-sink", gst.element_factory_make("fakesink"))
+        self.pipe.set_property("video-sink", sink)
+        self.sink = sink.get_by_name("pixbufsink")
+
+        bus = self.pipe.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self._on_message)
+
+    def start(self):
+        """
+            Preroll the pipeline. Seeking starts once it is paused.
+        """
+        if self.pipe.set_state(gst.STATE_PAUSED) == gst.STATE_CHANGE_FAILURE:
+            self.thumbnailer._grabber_error(self, _("Unable to preroll file!"))
+
+    def stop(self):
+        """
+            Tear down the pipeline.
+        """
+        self.pipe.get_bus().remove_signal_watch()
+        self.pipe.set_state(gst.STATE_NULL)
+
+    def _next(self):
+        """
+            Seek to the next position handed out by the thumbnailer or stop
+            if there are none left.
+        """
+        self.position = self.thumbnailer._next_position()
+        if self.position is None:
+            self.stop()
+            self.thumbnailer._grabber_done(self)
+            return
+
+        self.seeking = True
+        index, timestamp = self.position
+        if not self.pipe.seek_simple(gst.FORMAT_TIME,
+                                     gst.SEEK_FLAG_FLUSH | \
+                                     gst.SEEK_FLAG_KEY_UNIT, timestamp):
+            _log.debug(_("Seek to %(time)d failed") % {
+                "time": timestamp,
+            })
+            self.seeking = False
+            self._next()
+
+    def _on_message(self, bus, message):
+        t = message.type
+        if t == gst.MESSAGE_ASYNC_DONE:
+            if self.seeking:
+                # A flushing seek prerolls a new frame into the sink
+                self.seeking = False
+                index, timestamp = self.position
+                pixbuf = self.sink.get_property("last-pixbuf")
+                if pixbuf:
+                    self.thumbnailer._got_frame(index, timestamp, pixbuf)
+            self._next()
+        elif t == gst.MESSAGE_ERROR:
+            error, debug = message.parse_error()
+            self.stop()
+            self.thumbnailer._grabber_error(self, str(error))
+
+class Thumbnailer(gobject.GObject):
+    """
+        Generate individual thumbnails and a contact sheet for a discovered
+        media file. Several pipelines seek in parallel and only keyframes
+        are decoded, so even long files are processed quickly.
+
+        Emits "complete" with a list of written paths (contact sheet first)
+        or "error" with an error string.
+    """
+    __gsignals__ = {
+        "complete": (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE,
+                    (gobject.TYPE_PYOBJECT,)),     # paths
+        "error": (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE,
+                 (gobject.TYPE_PYOBJECT,)),        # error
+    }
+
+    def __init__(self, info, prefix, count=9, width=160, columns=3,
+                 format="jpeg", pipelines=3):
+        """
+            @type info: arista.discoverer.Discoverer
+            @param info: Discovered information about the file
+            @type prefix: str
+            @param prefix: The output path prefix, e.g. "out/movie" writes
+                           out/movie-sheet.jpg, out/movie-001.jpg, ...
+            @type count: int
+            @param count: The number of thumbnails to generate
+            @type width: int
+            @param width: The width in pixels of each thumbnail, the height
+                          is calculated from the video aspect ratio
+            @type columns: int
+            @param columns: The number of columns in the contact sheet
+            @type format: str
+            @param format: The image format, either "jpeg" or "png"
+            @type pipelines: int
+            @param pipelines: The number of pipelines seeking in parallel
+        """
+        self.__gobject_init__()
+
+        if not info.is_video:
+            raise ThumbnailerException(_("No video stream found!"))
+
+        if format not in ["jpeg", "png"]:
+            raise ThumbnailerException(_("Unsupported image format " \
+                                         "%(format)s!") % {
+                "format": format,
+            })
+
+        self.info = info
+        self.prefix = prefix
+        self.count = count
+        self.width = width
+        self.columns = columns
+        self.format = format
+
+        owidth = info.videowidth
+        try:
+            if info.videocaps[0].has_key("pixel-aspect-ratio"):
+                owidth = int(owidth * float(info.videocaps[0]["pixel-aspect-ratio"]))
+        except KeyError:
+            pass
+
+        self.height = int(float(width) / max(owidth, 1) * info.videoheight)
+        if self.height % 2:
+            self.height += 1
+
+        # Evenly spaced positions, avoiding the very start and end which are
+        # often black frames
+        length = max(info.length, 0)
+        self._positions = [(x, length * (x + 1) / (count + 1)) \
+                           for x in range(count)]
+        self._pending = list(self._positions)
+        self._frames = {}
+        self._failed = False
+
+        uri = info.filename
+        if "://" not in uri:
+            uri = "file://" + os.path.abspath(uri)
+
+        self._grabbers = [_FrameGrabber(self, uri, self.width, self.height) \
+                          for x in range(max(1, min(pipelines, count)))]
+        self._running = len(self._grabbers)
+
+    def start(self):
+        """
+            Start grabbing frames.
+        """
+        self.start_time = gobject.get_current_time()
+        for grabber in self._grabbers:
+            grabber.start()
+
+    def _next_position(self):
+        if self._failed or not self._pending:
+            return None
+
+        return self._pending.pop(0)
+
+    def _got_frame(self, index, timestamp, pixbuf):
+        self._frames[index] = pixbuf
+
+    def _grabber_error(self, grabber, errorstr):
+        if not self._failed:
+            self._failed = True
+            for other in self._grabbers:
+                if other is not grabber:
+                    other.stop()
+            self.emit("error", errorstr)
+
+    def _grabber_done(self, grabber):
+        self._running -= 1
+        if self._running or self._failed:
+            return
+
+        _log.debug(_("Grabbed %(count)d frames in %(time).2fs") % {
+            "count": len(self._frames),
+            "time": gobject.get_current_time() - self.start_time,
+        })
+
+        try:
+            paths = self._save()
+        except (ThumbnailerException, gobject.GError), e:
+            self.emit("error", str(e))
+            return
+
+        self.emit("complete", paths)
+
+    def _save(self):
+        """
+            Write the contact sheet and individual thumbnails to disk.
+
+            @rtype: list
+            @return: The written paths, the contact sheet first
+        """
+        import gtk.gdk
+
+        if not self._frames:
+            raise ThumbnailerException(_("No frames could be decoded!"))
+
+        extension = self.format == "jpeg" and "jpg" or "png"
+
+        rows = (len(self._frames) + self.columns - 1) / self.columns
+        columns = min(self.columns, len(self._frames))
+        sheet = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8,
+                               columns * self.width, rows * self.height)
+        sheet.fill(0x000000ff)
+
+        paths = ["%s-sheet.%s" % (self.prefix, extension)]
+        for pos, index in enumerate(sorted(self._frames.keys())):
+            pixbuf = self._frames[index]
+            path = "%s-%03d.%s" % (self.prefix, index + 1, extension)
+            pixbuf.save(path, self.format)
+            paths.append(path)
+
+            pixbuf.copy_area(0, 0, min(pixbuf.get_width(), self.width),
+                             min(pixbuf.get_height(), self.height), sheet,
+                             (pos % columns) * self.width,
+                             (pos / columns) * self.height)
+
+        sheet.save(paths[0], self.format)
+
+        return paths
+
+gobject.type_register(Thumbnailer)
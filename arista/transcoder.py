@@ -26,10 +26,17 @@
     <http://www.gnu.org/licenses/>.
 """
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 import gettext
 import logging
+import math
 import os
 import os.path
+import shutil
 import sys
 import time
 
@@ -48,10 +55,43 @@ import gobject
 import gst
 
 import discoverer
+import dvd
+import history
 
 _ = gettext.gettext
 _log = logging.getLogger("arista.transcoder")
 
+# Containers whose output files can be joined losslessly by appending them
+# byte for byte, which is required for checkpointed encodes. An empty string
+# means no container, e.g. plain MPEG audio.
+CONCAT_CONTAINERS = ["", "ffmux_dvd", "ffmux_mpeg", "ffmux_mpegts",
+                     "ffmux_vob", "mpegpsmux", "mpegtsmux", "oggmux"]
+
+# Encoders whose output mpegtsmux accepts, which streaming output requires
+HLS_VCODECS = ["ffenc_mpeg1video", "ffenc_mpeg2video", "ffenc_mpeg4",
+               "mpeg2enc", "schroenc", "x264enc"]
+HLS_ACODECS = ["faac", "ffenc_aac", "ffenc_ac3", "ffenc_mp2", "lame",
+               "twolame", "voaacenc"]
+
+# Return values of the decodebin2 autoplug-select signal, see the
+# GstAutoplugSelectResult enum
+AUTOPLUG_SELECT_TRY = 0
+AUTOPLUG_SELECT_SKIP = 2
+
+# Caps of container formats, which demuxers may also output when a stream
+# is wrapped in another container or tagged, e.g. ID3 tagged MP3 in AVI
+CONTAINER_CAPS = ["application/ogg", "application/x-apetag",
+                  "application/x-id3", "audio/ogg", "audio/x-m4a",
+                  "audio/x-matroska", "video/mpegts", "video/ogg",
+                  "video/quicktime", "video/webm", "video/x-flv",
+                  "video/x-matroska", "video/x-ms-asf", "video/x-msvideo"]
+
+# Caps of subtitle streams
+SUBTITLE_CAPS = ["application/x-ass", "application/x-ssa",
+                 "application/x-subtitle", "application/x-usf",
+                 "subpicture/x-dvd", "subpicture/x-pgs",
+                 "video/x-dvd-subpicture"]
+
 # =============================================================================
 # Custom exceptions
 # =============================================================================
@@ -76,6 +116,26 @@ class PipelineException(TranscoderException):
     """
     pass
 
+def check_hls(preset):
+    """
+        Make sure the codecs of a preset can be written into streaming
+        segments, which are always MPEG transport streams.
+        
+        @type preset: arista.presets.Preset
+        @param preset: The preset to check
+        @raise TranscoderException: A codec can't be streamed
+    """
+    for codec, supported in [(preset.vcodec, HLS_VCODECS),
+                             (preset.acodec, HLS_ACODECS)]:
+        name = codec and codec.name and codec.name.split()[0]
+        if name and name not in supported:
+            raise TranscoderException(_("%(codec)s can't be used for " \
+                                        "streaming output, only " \
+                                        "%(supported)s") % {
+                "codec": name,
+                "supported": ", ".join(supported),
+            })
+
 # =============================================================================
 # Transcoder Options
 # =============================================================================
@@ -88,7 +148,8 @@ class TranscoderOptions(object):
     def __init__(self, uri = None, preset = None, output_uri = None, ssa = False,
                  subfile = None, subfile_charset = None, font = "Sans Bold 16",
                  deinterlace = None, crop = None, title = None, chapter = None,
-                 audio = None):
+                 audio = None, checkpoint = None, subtitle = None,
+                 hls = None):
         """
             @type uri: str
             @param uri: The URI to the input file, device, or stream
@@ -113,15 +174,28 @@ class TranscoderOptions(object):
             @type chatper: int
             @param chapter: DVD chapter index
             @type audio: int
-            @param audio: DVD audio stream index
+            @param audio: Audio stream index, starting at 1, of a DVD or
+                          file; all other audio streams are not decoded
+            @type checkpoint: int
+            @param checkpoint: Encode in independent segments of this many
+                               seconds and keep a progress manifest so that
+                               an interrupted encode can be resumed
+            @type subtitle: int
+            @param subtitle: Embedded subtitle stream index, starting at 1,
+                             to render onto the video
+            @type hls: int
+            @param hls: Write an HTTP live streaming playlist to output_uri
+                        and MPEG-TS segments of this many seconds next to
+                        it, which can be played while the encode runs
         """
         self.reset(uri, preset, output_uri, ssa,subfile, subfile_charset, font,
-                   deinterlace, crop, title, chapter, audio)
+                   deinterlace, crop, title, chapter, audio, checkpoint,
+                   subtitle, hls)
     
     def reset(self, uri = None, preset = None, output_uri = None, ssa = False,
               subfile = None, subfile_charset = None, font = "Sans Bold 16",
               deinterlace = None, crop = None, title = None, chapter = None,
-              audio = None):
+              audio = None, checkpoint = None, subtitle = None, hls = None):
         """
             Reset the input options to nothing.
         """
@@ -137,6 +211,9 @@ class TranscoderOptions(object):
         self.title = title
         self.chapter = chapter
         self.audio = audio
+        self.checkpoint = checkpoint
+        self.subtitle = subtitle
+        self.hls = hls
 
 # =============================================================================
 # The Transcoder
@@ -160,14 +237,25 @@ class Transcoder(gobject.GObject):
                  (gobject.TYPE_PYOBJECT,)),        # error
     }
     
-    def __init__(self, options):
+    def __init__(self, options, autostart=True, record_history=True):
         """
             @type options: TranscoderOptions
             @param options: The options, like input uri, subtitles, preset, 
                             output uri, etc.
+            @type autostart: bool
+            @param autostart: Start encoding as soon as the input has been
+                              discovered; set to False to only discover the
+                              input, e.g. to call plan() afterward
+            @type record_history: bool
+            @param record_history: Record the finished encode in the encode
+                                   history used to estimate future encodes;
+                                   set to False for unusual inputs, e.g.
+                                   generated test media
         """
         self.__gobject_init__()
         self.options = options
+        self.autostart = autostart
+        self.record_history = record_history
         
         self.pipe = None
         
@@ -175,6 +263,23 @@ class Transcoder(gobject.GObject):
         
         self._percent_cached = 0
         self._percent_cached_time = 0
+        self._elapsed = 0.0
+        self._position = 0
+        
+        # Checkpointed encoding state, see _load_checkpoint
+        self.segment = 0
+        self._checkpoint = None
+        self._segment_seek_pending = False
+        
+        # Segmented streaming output state, see _setup_hls
+        self._hls = None
+        
+        if options.hls and options.checkpoint:
+            raise TranscoderException(_("Streaming output can't be " \
+                                        "checkpointed!"))
+        
+        if options.hls:
+            check_hls(options.preset)
         
         if options.uri.startswith("dvd://") and len(options.uri.split("@")) < 2:
             options.uri += "@%(title)s:%(chapter)s:%(audio)s" % {
@@ -183,78 +288,83 @@ class Transcoder(gobject.GObject):
                 "audio": options.audio or "a",
             }
             
+        self.info = None
+        
         if options.uri.startswith("dvd://") and not options.title:
             # This is a DVD and no title is yet selected... find the best
-            # candidate by searching for the longest title!
-            parts = options.uri.split("@")
-            options.uri = parts[0] + "@0:a:a"
-            self.dvd_infos = []
-            
-            def _got_info(info, is_media):
-                self.dvd_infos.append([discoverer, info])
-                parts = self.options.uri.split("@")
-                fname = parts[0]
-                title = int(parts[1].split(":")[0])
-                if title >= 8:
-                    # We've checked 8 titles, let's give up and pick the
-                    # most likely to be the main feature.
-                    longest = 0
-                    self.info = None
-                    for disco, info in self.dvd_infos:
-                        if info.length > longest:
-                            self.discoverer = disco
-                            self.info = info
-                            longest = info.length
-                    
-                    if not self.info:
-                        self.emit("error", _("No valid DVD title found!"))
-                        return
-                    
-                    self.options.uri = self.info.filename
-                    
-                    _log.debug(_("Longest title found is %(filename)s") % {
-                        "filename": self.options.uri,
-                    })
-                    
-                    self.emit("discovered", self.info, self.info.is_video or self.info.is_audio)
-                    
-                    if self.info.is_video or self.info.is_audio:
-                        try:
-                            self._setup_pass()
-                        except PipelineException, e:
-                            self.emit("error", str(e))
-                            return
-                        
-                        self.start()
-                        return
-                
-                self.options.uri = fname + "@" + str(title + 1) + ":a:a"
-                self.discoverer = discoverer.Discoverer(options.uri)
-                self.discoverer.connect("discovered", _got_info)
-                self.discoverer.discover()
+            # candidate by looking for the longest title. A single lsdvd
+            # run reads all titles at once and is cached per disc.
+            self.dvd_info = dvd.DvdInfo(options.uri.split("@")[0][6:])
+            self.dvd_info.connect("ready", self._got_dvd_info)
+            self.dvd_info.connect("error", self._dvd_info_error)
+        else:
+            self._discover()
+    
+    def _got_dvd_info(self, dvd_info, lsdvd):
+        """
+            DVD title info is available, pick the longest title and discover
+            it.
+        """
+        title = dvd.get_longest_title(lsdvd)
+        if not title:
+            self.emit("error", _("No valid DVD title found!"))
+            return
+        
+        parts = self.options.uri.split("@")
+        rest = parts[1].split(":")
+        self.options.uri = "%s@%d:%s" % (parts[0], title, ":".join(rest[1:]))
+        
+        _log.debug(_("Longest title found is %(filename)s") % {
+            "filename": self.options.uri,
+        })
+        
+        self._discover()
+    
+    def _dvd_info_error(self, dvd_info):
+        self.emit("error", _("Unable to read DVD titles, is lsdvd " \
+                             "installed?"))
+    
+    def _discover(self):
+        """
+            Discover the input and start encoding if autostart is set.
+        """
+        info = discoverer.get_cached(self.options.uri)
+        if info is not None:
+            # Nothing to build, but callers connect after construction
+            gobject.idle_add(self._got_info, info, True)
+            return
+        
+        def _got_info(dis, is_media):
+            # Only keep the small info object, not the discovery pipeline
+            info = dis.media_info
+            dis.set_state(gst.STATE_NULL)
+            self.discoverer = None
             
-            self.discoverer = discoverer.Discoverer(options.uri)
-            self.discoverer.connect("discovered", _got_info)
-            self.discoverer.discover()
+            self._got_info(info, is_media)
         
-        else:
-            def _got_info(info, is_media):
-                self.info = info
-                self.emit("discovered", info, is_media)
+        self.discoverer = discoverer.Discoverer(self.options.uri,
+                                                lookup=False)
+        self.discoverer.connect("discovered", _got_info)
+        self.discoverer.discover()
+    
+    def _got_info(self, info, is_media):
+        """
+            Use the discovered input info and start encoding if autostart
+            is set.
+        """
+        self.info = info
+        self.emit("discovered", info, is_media)
+        
+        if self.autostart and (info.is_video or info.is_audio):
+            try:
+                self._setup_pass()
+            except PipelineException, e:
+                self.emit("error", str(e))
+                return False
                 
-                if info.is_video or info.is_audio:
-                    try:
-                        self._setup_pass()
-                    except PipelineException, e:
-                        self.emit("error", str(e))
-                        return
-                        
-                    self.start()
-            
-            self.info = None
-            self.discoverer = discoverer.Discoverer(options.uri)
-            self.discoverer.connect("discovered", _got_info)
-            self.discoverer.discover()
+            self.start()
+        
+        return False
     
     @property
     def infile(self):
@@ -307,20 +417,171 @@ class Transcoder(gobject.GObject):
                 self.options.deinterlace = True
             
             return "dvdreadsrc device=\"%s\" title=%d %s ! decodebin2 name=dmux" % (device, title, chapter and "chapter=" + str(chapter) or '')
-        elif self.infile.startswith("v4l://") or self.infile.startswith("v4l2://"):
-            filename = self.infile
+        
+        return "uridecodebin uri=\"%s\" name=dmux" % self._get_uri()
+    
+    def _get_uri(self):
+        """
+            @rtype: str
+            @return: The input as a URI usable with uridecodebin
+        """
+        if self.infile.startswith("v4l://") or self.infile.startswith("v4l2://"):
+            return self.infile
         elif self.infile.startswith("file://"):
-            filename = self.infile
+            return self.infile
+        else:
+            return "file://" + os.path.abspath(self.infile)
+    
+    def _encodes_audio(self):
+        """
+            @rtype: bool
+            @return: Whether audio is encoded during the current pass
+        """
+        return bool(self.info.is_audio and self.preset.acodec and \
+                    self.enc_pass == len(self.preset.vcodec.passes) - 1)
+    
+    def _setup_stream_selection(self):
+        """
+            Make sure streams that are not used in this pass are dropped
+            before they are decoded, see _autoplug_select_cb.
+        """
+        self._stream_indexes = {}
+        self._stream_counts = {}
+        
+        for name in ["dmux", "subdmux"]:
+            element = self.pipe.get_by_name(name)
+            if element:
+                element.connect("autoplug-select", self._autoplug_select_cb,
+                                name)
+    
+    def _get_stream_kind(self, caps):
+        """
+            @rtype: str
+            @return: Either "video", "audio" or "subtitle", or None if the
+                     caps are not an elementary stream
+        """
+        structure = caps[0]
+        name = structure.get_name()
+        if name in CONTAINER_CAPS:
+            return None
+        elif structure.has_field("systemstream") and \
+             structure["systemstream"]:
+            # MPEG program/transport streams and DV
+            return None
+        elif name in SUBTITLE_CAPS or name.startswith("text/"):
+            return "subtitle"
+        elif name.startswith("video/") or name.startswith("image/"):
+            return "video"
+        elif name.startswith("audio/"):
+            return "audio"
+        else:
+            return None
+    
+    def _autoplug_select_cb(self, dbin, pad, caps, factory, name):
+        """
+            Decide whether a stream gets decoded. Only the first video
+            stream, the selected audio stream when audio is encoded in this
+            pass and the selected subtitle stream are kept.
+        """
+        # Only elementary streams coming out of a demuxer are numbered,
+        # everything else (typefind, parsers, decoders and nested
+        # containers) continues a stream that was already selected
+        target = pad
+        if isinstance(pad, gst.GhostPad) and pad.get_target():
+            target = pad.get_target()
+        element = target.get_parent_element()
+        if not element or not element.get_factory() or \
+           "Demuxer" not in element.get_factory().get_klass():
+            return AUTOPLUG_SELECT_TRY
+        
+        kind = self._get_stream_kind(caps)
+        if not kind:
+            return AUTOPLUG_SELECT_TRY
+        
+        key = (name, target)
+        if key not in self._stream_indexes:
+            count = self._stream_counts.get((name, kind), 0)
+            self._stream_counts[(name, kind)] = count + 1
+            self._stream_indexes[key] = count
+        index = self._stream_indexes[key]
+        
+        if name == "subdmux":
+            # This one only provides the subtitle stream
+            keep = kind == "subtitle" and index == self.options.subtitle - 1
+        elif kind == "video":
+            keep = index == 0
+        elif kind == "audio":
+            keep = self._encodes_audio() and \
+                   index == (self.options.audio or 1) - 1
         else:
-            filename = "file://" + os.path.abspath(self.infile)
+            keep = False
+        
+        if not keep:
+            _log.debug(_("Skipping %(kind)s stream %(index)d") % {
+                "kind": kind,
+                "index": index + 1,
+            })
+            return AUTOPLUG_SELECT_SKIP
+        
+        return AUTOPLUG_SELECT_TRY
+    
+    def _get_container(self):
+        """
+            Figure out which mux element to use based on the input streams.
             
-        return "uridecodebin uri=\"%s\" name=dmux" % filename
+            @rtype: str
+            @return: The muxer element and its options or None
+        """
+        if self.options.hls:
+            # Streaming segments must be independently playable
+            return "mpegtsmux"
+        
+        container = None
+        if self.info.is_video and self.info.is_audio:
+            container = self.preset.container
+        elif self.info.is_video:
+            container = self.preset.vcodec.container and \
+                        self.preset.vcodec.container or \
+                        self.preset.container
+        elif self.info.is_audio:
+            container = self.preset.acodec.container and \
+                        self.preset.acodec.container or \
+                        self.preset.container
+        
+        return container
     
     def _setup_pass(self):
         """
             Setup the pipeline for an encoding pass. This configures the
             GStreamer elements and their setttings for a particular pass.
         """
+        if self.options.checkpoint and self._checkpoint is None:
+            self._load_checkpoint(self._get_container())
+        
+        cmd = self._get_pass_command()
+        
+        # =====================================================================
+        # Build the pipeline and get ready!
+        # =====================================================================
+        self._build_pipeline(cmd)
+        self._setup_stream_selection()
+        
+        if self.options.checkpoint:
+            self._setup_segment()
+        
+        if self.options.hls and self.enc_pass == self.preset.pass_count - 1:
+            self._setup_hls()
+        
+        self.emit("pass-setup")
+    
+    def _get_pass_command(self):
+        """
+            Generate the gst-launch style string for the current encoding
+            pass. This also sets self.vcaps and self.acaps.
+            
+            @rtype: str
+            @return: The pipeline description for this pass
+        """
         # Get limits and setup caps
         self.vcaps = gst.Caps()
         self.vcaps.append_structure(gst.Structure("video/x-raw-yuv"))
@@ -335,17 +596,7 @@ class Transcoder(gobject.GObject):
         # =====================================================================
         
         # Figure out which mux element to use
-        container = None
-        if self.info.is_video and self.info.is_audio:
-            container = self.preset.container
-        elif self.info.is_video:
-            container = self.preset.vcodec.container and \
-                        self.preset.vcodec.container or \
-                        self.preset.container
-        elif self.info.is_audio:
-            container = self.preset.acodec.container and \
-                        self.preset.acodec.container or \
-                        self.preset.container
+        container = self._get_container()
         
         mux_str = ""
         if container:
@@ -360,8 +611,23 @@ class Transcoder(gobject.GObject):
         
         src = self._get_source()
         
-        cmd = "%s %s filesink name=sink " \
-              "location=\"%s\"" % (src, mux_str, self.options.output_uri)
+        output = self.options.output_uri
+        if self.options.checkpoint and self._checkpoint is not None:
+            output = self._get_segment_path(self.segment)
+        
+        sink = "filesink name=sink location=\"%s\"" % output
+        if self.options.hls:
+            if self.enc_pass < self.preset.pass_count - 1:
+                # Only the final pass writes segments players may pick up
+                sink = "fakesink name=sink"
+            else:
+                # A new file is started at each forced keyframe
+                prefix = os.path.splitext(self.options.output_uri)[0]
+                sink = "multifilesink name=sink location=\"%s-%%05d.ts\" " \
+                       "next-file=key-unit-event post-messages=true" % \
+                       prefix.replace("%", "%%")
+        
+        cmd = "%s %s %s" % (src, mux_str, sink)
             
         if self.info.is_video and self.preset.vcodec:
             # =================================================================
@@ -546,19 +812,31 @@ class Transcoder(gobject.GObject):
                     "infile": self.infile,
                 }
             
+            if self.options.subtitle and not self.infile.startswith("dvd://"):
+                # Render an embedded subtitle stream onto the video. A
+                # separate decoder only exposes that one text stream so it
+                # can't be mixed up with the audio and video streams.
+                sub = "textoverlay font-desc=\"%(font)s\" name=txt ! " % {
+                    "font": self.options.font,
+                }
+                cmd += " uridecodebin uri=\"%(uri)s\" name=subdmux " \
+                       "caps=\"text/x-pango-markup;text/plain\" " \
+                       "subdmux. ! queue ! txt. " % {
+                    "uri": self._get_uri(),
+                }
+            
             vmux = premux
             if container in ["qtmux", "webmmux", "ffmux_dvd", "matroskamux"]:
                 if premux.startswith("mux"):
                     vmux += "video_%d"
             
-            cmd += " dmux. ! queue ! ffmpegcolorspace ! videorate !" \
+            cmd += " dmux. ! queue name=vqueue ! ffmpegcolorspace ! videorate !" \
                    "%s %s %s %s videoscale ! %s ! %s%s ! tee " \
                    "name=videotee ! queue ! %s" % \
                    (deint, vcrop, transform, sub, self.vcaps.to_string(), vbox,
                     vencoder, vmux)
             
-        if self.info.is_audio and self.preset.acodec and \
-           self.enc_pass == len(self.preset.vcodec.passes) - 1:
+        if self._encodes_audio():
             # =================================================================
             # Update limits based on what the encoder really supports
             # =================================================================
@@ -620,17 +898,91 @@ class Transcoder(gobject.GObject):
                 if premux.startswith("mux"):
                     amux += "audio_%d"
             
-            cmd += " dmux. ! queue ! audioconvert ! " \
+            cmd += " dmux. ! queue name=aqueue ! audioconvert ! " \
                    "audiorate tolerance=100000000 ! " \
                    "audioresample ! %s ! %s ! %s" % \
                    (self.acaps.to_string(), aencoder, amux)
         
-        # =====================================================================
-        # Build the pipeline and get ready!
-        # =====================================================================
-        self._build_pipeline(cmd)
+        return cmd
+    
+    def plan(self):
+        """
+            Describe what encoding the discovered input will do without
+            building or starting any pipelines. Only valid once the input
+            has been discovered, e.g. create the transcoder with
+            autostart=False and call this from the discovered signal.
+            
+            @rtype: dict
+            @return: A dictionary with the input and output, the pipeline
+                     string of each pass, the chosen video width, height and
+                     framerate, the audio caps, the pass count and the
+                     estimated encode time in seconds and output size in
+                     bytes (None when no history has been recorded for
+                     this preset yet)
+        """
+        enc_pass = self.enc_pass
+        passes = []
+        try:
+            for x in range(self.preset.pass_count):
+                self.enc_pass = x
+                passes.append(self._get_pass_command())
+        finally:
+            self.enc_pass = enc_pass
         
-        self.emit("pass-setup")
+        width = height = framerate = None
+        if self.info.is_video:
+            width = self.vcaps[0]["width"]
+            height = self.vcaps[0]["height"]
+            rate = self.vcaps[0]["framerate"]
+            framerate = "%d/%d" % (rate.num, rate.denom)
+        
+        acaps = None
+        if self.info.is_audio:
+            acaps = self.acaps.to_string()
+        
+        duration = max(self.info.videolength, self.info.audiolength)
+        est_time, est_size = history.estimate(self.preset,
+                                              float(duration) / gst.SECOND)
+        
+        return {
+            "uri": self.options.uri,
+            "output_uri": self.options.output_uri,
+            "duration": float(duration) / gst.SECOND,
+            "pass_count": self.preset.pass_count,
+            "passes": passes,
+            "width": width,
+            "height": height,
+            "framerate": framerate,
+            "audio_caps": acaps,
+            "estimated_time": est_time,
+            "estimated_size": est_size,
+        }
+    
+    def _record_history(self):
+        """
+            Record the speed and output size of a finished encode so future
+            encodes with this preset can be estimated.
+        """
+        duration = max(self.info.videolength, self.info.audiolength)
+        if duration <= 0 or self._position < duration * 0.95:
+            # Stopped early or unknown duration, don't skew the history
+            return
+        
+        media = float(duration) / gst.SECOND
+        if self._checkpoint is not None:
+            # Only part of the input was encoded if this run was resumed
+            media = float(duration - self._resumed_from) / gst.SECOND
+        
+        try:
+            if self._hls is not None:
+                size = sum([os.path.getsize(self._get_hls_segment_path(x)) \
+                            for x in range(len(self._hls["segments"]))])
+            else:
+                size = os.path.getsize(self.options.output_uri)
+        except OSError:
+            return
+        
+        history.record(self.preset, media, self._elapsed, size)
     
     def _build_pipeline(self, cmd):
         """
@@ -653,6 +1005,325 @@ class Transcoder(gobject.GObject):
         bus.add_signal_watch()
         bus.connect("message", self._on_message)
     
+    def _get_checkpoint_path(self, *parts):
+        """
+            Get a path inside the directory that holds the finished segments
+            and progress manifest of a checkpointed encode.
+            
+            @rtype: str
+            @return: The full path
+        """
+        return os.path.join(self.options.output_uri + ".parts", *parts)
+    
+    def _get_segment_path(self, segment):
+        """
+            @type segment: int
+            @param segment: The segment index
+            @rtype: str
+            @return: The output path of a single checkpointed segment
+        """
+        return self._get_checkpoint_path("segment-%05d.%s" % (segment,
+                                         self.preset.extension))
+    
+    def _load_checkpoint(self, container):
+        """
+            Load the progress manifest of a previous run with the same
+            options, if any, and skip all segments it has already finished.
+            
+            @type container: str
+            @param container: The muxer element used for this encode
+            @raise PipelineException: Checkpointing is not possible for this
+                                      container or input
+        """
+        container = (container or "").split(" ")[0]
+        if container not in CONCAT_CONTAINERS:
+            raise PipelineException(_("Checkpointed encoding is not " \
+                                      "supported for %(container)s!") % {
+                "container": container,
+            })
+        
+        duration = max(self.info.videolength, self.info.audiolength)
+        if not duration or duration < 0:
+            raise PipelineException(_("Checkpointed encoding requires an " \
+                                      "input with a known duration!"))
+        
+        length = int(self.options.checkpoint * gst.SECOND)
+        self._checkpoint = {
+            "uri": self.options.uri,
+            "preset": self.preset.name,
+            "segment_length": self.options.checkpoint,
+            "segments": [],
+        }
+        self._segment_count = int((duration + length - 1) / length)
+        
+        manifest = self._get_checkpoint_path("manifest.json")
+        if os.path.exists(manifest):
+            try:
+                previous = json.loads(open(manifest).read())
+            except ValueError:
+                previous = {}
+            
+            if [previous.get(key) for key in ["uri", "preset", "segment_length"]] == \
+               [self._checkpoint[key] for key in ["uri", "preset", "segment_length"]]:
+                self._checkpoint["segments"] = previous.get("segments", [])
+                _log.info(_("Resuming %(uri)s after %(count)d of %(total)d " \
+                            "segments") % {
+                    "uri": self.options.uri,
+                    "count": len(self._checkpoint["segments"]),
+                    "total": self._segment_count,
+                })
+            else:
+                shutil.rmtree(self._get_checkpoint_path())
+        
+        if not os.path.exists(self._get_checkpoint_path()):
+            os.makedirs(self._get_checkpoint_path())
+        
+        if len(self._checkpoint["segments"]) >= self._segment_count:
+            # Interrupted while joining, redo the last segment to finish up
+            self._checkpoint["segments"] = \
+                self._checkpoint["segments"][:self._segment_count - 1]
+        
+        self.segment = len(self._checkpoint["segments"])
+        self._resumed_from = self.segment * length
+    
+    def _save_checkpoint(self):
+        """
+            Atomically write the progress manifest.
+        """
+        manifest = self._get_checkpoint_path("manifest.json")
+        open(manifest + ".tmp", "w").write(json.dumps(self._checkpoint,
+                                                      indent=4))
+        os.rename(manifest + ".tmp", manifest)
+    
+    def _get_segment_bounds(self):
+        """
+            @rtype: tuple
+            @return: The start and stop time in nanoseconds of the current
+                     segment
+        """
+        length = int(self.options.checkpoint * gst.SECOND)
+        duration = max(self.info.videolength, self.info.audiolength)
+        
+        return self.segment * length, min((self.segment + 1) * length,
+                                          duration)
+    
+    def _setup_segment(self):
+        """
+            Prepare a freshly built pipeline to encode only the current
+            segment. Nothing reaches the muxer until the seek to the start
+            of the segment has flushed the pipeline.
+        """
+        self._segment_seek_pending = True
+        self._segment_seeking = False
+        self._segment_open = {}
+        self._segment_position = 0
+        
+        for name in ["vqueue", "aqueue"]:
+            element = self.pipe.get_by_name(name)
+            if element:
+                pad = element.get_pad("sink")
+                self._segment_open[pad] = False
+                pad.add_buffer_probe(self._segment_buffer_probe)
+                pad.add_event_probe(self._segment_event_probe)
+        
+        dmux = self.pipe.get_by_name("dmux")
+        dmux.connect("no-more-pads", lambda dmux: gobject.idle_add(
+                                                    self._seek_segment))
+    
+    def _seek_segment(self):
+        """
+            Seek to the current segment and start playback. The stop
+            position makes the pipeline post EOS at the end of the segment.
+        """
+        start, stop = self._get_segment_bounds()
+        
+        self._segment_seeking = True
+        if not self.pipe.seek(1.0, gst.FORMAT_TIME,
+                              gst.SEEK_FLAG_FLUSH | gst.SEEK_FLAG_ACCURATE,
+                              gst.SEEK_TYPE_SET, start,
+                              gst.SEEK_TYPE_SET, stop):
+            self.emit("error", _("Unable to seek to segment %(segment)d!") % {
+                "segment": self.segment,
+            })
+            return False
+        
+        self.state = gst.STATE_PLAYING
+        
+        return False
+    
+    def _segment_event_probe(self, pad, event):
+        if event.type == gst.EVENT_FLUSH_STOP and self._segment_seeking:
+            self._segment_open[pad] = True
+        
+        return True
+    
+    def _segment_buffer_probe(self, pad, buffer):
+        if not self._segment_open.get(pad):
+            # Prerolled data from before the segment seek
+            return False
+        
+        if buffer.timestamp != gst.CLOCK_TIME_NONE:
+            self._segment_position = max(self._segment_position,
+                                         buffer.timestamp)
+        
+        return True
+    
+    def _segment_complete(self):
+        """
+            @rtype: bool
+            @return: Whether the current segment was encoded up to its end
+        """
+        start, stop = self._get_segment_bounds()
+        
+        return self._segment_position >= stop - 2 * gst.SECOND
+    
+    def _finish_segment(self):
+        """
+            Record the current segment as done. Once all segments are done
+            they are joined into the output file.
+            
+            @rtype: bool
+            @return: True if there are more segments left to encode
+        """
+        self._checkpoint["segments"].append(
+            os.path.basename(self._get_segment_path(self.segment)))
+        self._save_checkpoint()
+        
+        if self.segment < self._segment_count - 1:
+            return True
+        
+        # All done, join the segments into the requested output
+        out = open(self.options.output_uri, "wb")
+        for name in self._checkpoint["segments"]:
+            segment = open(self._get_checkpoint_path(name), "rb")
+            shutil.copyfileobj(segment, out)
+            segment.close()
+        out.close()
+        
+        shutil.rmtree(self._get_checkpoint_path())
+        
+        return False
+    
+    def _get_hls_segment_path(self, index):
+        """
+            @type index: int
+            @param index: The segment number, starting at 0
+            @rtype: str
+            @return: The path of a single streaming segment, which is
+                     written next to the playlist
+        """
+        return "%s-%05d.ts" % (os.path.splitext(self.options.output_uri)[0],
+                               index)
+    
+    def _setup_hls(self):
+        """
+            Prepare a freshly built pipeline to write streaming segments.
+            Keyframes are forced at every segment boundary so that each
+            segment starts with one and can be decoded on its own.
+        """
+        self._hls = {
+            "length": int(self.options.hls * gst.SECOND),
+            "first": None,
+            "boundaries": [0],
+            "closed": 0,
+            "end": 0,
+            "segments": [],
+        }
+        
+        # Boundaries are decided on the video stream if there is one, the
+        # force keyframe event travels downstream through the encoder
+        for name in ["vqueue", "aqueue"]:
+            element = self.pipe.get_by_name(name)
+            if element:
+                pad = element.get_pad("src")
+                pad.add_buffer_probe(self._hls_buffer_probe)
+                break
+        
+        self._write_hls_playlist()
+    
+    def _hls_buffer_probe(self, pad, buffer):
+        if buffer.timestamp == gst.CLOCK_TIME_NONE:
+            return True
+        
+        # Segments are cut by running time, as timestamps of e.g. MPEG-TS
+        # input don't start near zero
+        if self._hls["first"] is None:
+            self._hls["first"] = buffer.timestamp
+        running = max(buffer.timestamp - self._hls["first"], 0)
+        
+        end = running
+        if buffer.duration != gst.CLOCK_TIME_NONE:
+            end += buffer.duration
+        self._hls["end"] = max(self._hls["end"], end)
+        
+        boundaries = self._hls["boundaries"]
+        if running >= len(boundaries) * self._hls["length"]:
+            structure = gst.Structure("GstForceKeyUnit")
+            structure.set_value("timestamp", buffer.timestamp, "guint64")
+            structure.set_value("stream-time", buffer.timestamp, "guint64")
+            structure.set_value("running-time", running, "guint64")
+            structure.set_value("all-headers", True, "gboolean")
+            structure.set_value("count", len(boundaries), "guint")
+            boundaries.append(running)
+            pad.push_event(gst.event_new_custom(gst.EVENT_CUSTOM_DOWNSTREAM,
+                                                structure))
+        
+        return True
+    
+    def _add_hls_segments(self, count):
+        """
+            Add finished segments to the playlist.
+            
+            @type count: int
+            @param count: The total number of finished segments
+        """
+        boundaries = self._hls["boundaries"]
+        segments = self._hls["segments"]
+        while len(segments) < min(count, len(boundaries)):
+            index = len(segments)
+            if not os.path.exists(self._get_hls_segment_path(index)):
+                break
+            
+            if index + 1 < len(boundaries):
+                end = boundaries[index + 1]
+            else:
+                end = self._hls["end"]
+            
+            segments.append(float(max(end - boundaries[index], 0)) / \
+                            gst.SECOND)
+    
+    def _write_hls_playlist(self, final=False):
+        """
+            Write the playlist of all finished segments. It is replaced
+            atomically so players never see a partial playlist.
+            
+            @type final: bool
+            @param final: Whether the encode is done and no more segments
+                          will be added
+        """
+        target = int(math.ceil(self.options.hls))
+        for duration in self._hls["segments"]:
+            target = max(target, int(round(duration)))
+        
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-TARGETDURATION:%d" % target,
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        
+        for index, duration in enumerate(self._hls["segments"]):
+            lines.append("#EXTINF:%.3f," % duration)
+            lines.append(os.path.basename(self._get_hls_segment_path(index)))
+        
+        if final:
+            lines.append("#EXT-X-ENDLIST")
+        
+        output = self.options.output_uri
+        open(output + ".tmp", "w").write("\n".join(lines) + "\n")
+        os.rename(output + ".tmp", output)
+    
     def _on_message(self, bus, message):
         """
             Process pipe bus messages, e.g. start new passes and emit signals
@@ -664,14 +1335,45 @@ class Transcoder(gobject.GObject):
             @param message: The message that was sent on the bus
         """
         t = message.type
-        if t == gst.MESSAGE_EOS:
+        if t == gst.MESSAGE_ELEMENT and self._hls is not None and \
+           message.structure and \
+           message.structure.get_name() == "GstMultiFileSink":
+            # The sink closed a segment file
+            self._hls["closed"] += 1
+            self._add_hls_segments(self._hls["closed"])
+            self._write_hls_playlist()
+        elif t == gst.MESSAGE_EOS:
+            self._elapsed += time.time() - self.start_time
+            try:
+                self._position = self.pipe.query_position(gst.FORMAT_TIME)[0]
+            except gst.QueryError:
+                pass
+            
             self.state = gst.STATE_NULL
             self.emit("pass-complete")
             if self.enc_pass < self.preset.pass_count - 1:
                 self.enc_pass += 1
                 self._setup_pass()
                 self.start()
+            elif self.options.checkpoint and not self._segment_complete():
+                # Stopped early, e.g. the user cancelled the encode. This
+                # segment is left out of the kept checkpoint so it will be
+                # encoded again when the encode is resumed.
+                self.emit("error", _("Segment %(segment)d stopped early, " \
+                                     "the encode can be resumed") % {
+                    "segment": self.segment,
+                })
+            elif self.options.checkpoint and self._finish_segment():
+                self.enc_pass = 0
+                self.segment += 1
+                self._setup_pass()
+                self.start()
             else:
+                if self._hls is not None:
+                    self._add_hls_segments(len(self._hls["boundaries"]))
+                    self._write_hls_playlist(final=True)
+                if self.record_history:
+                    self._record_history()
                 self.emit("complete")
         
         self.emit("message", bus, message)
@@ -680,9 +1382,16 @@ class Transcoder(gobject.GObject):
         """
             Start the pipeline!
         """
-        self.state = gst.STATE_PLAYING
         if reset_timer:
             self.start_time = time.time()
+        
+        if self._segment_seek_pending:
+            # Preroll first, the segment seek will start playback
+            self._segment_seek_pending = False
+            self.state = gst.STATE_PAUSED
+            return
+        
+        self.state = gst.STATE_PLAYING
     
     def pause(self):
         """
@@ -720,25 +1429,30 @@ class Transcoder(gobject.GObject):
     
     state = property(get_state, set_state)
     
-    def get_status(self):
+    def get_progress(self):
         """
-            Get information about the status of the encoder, such as the
-            percent completed and nicely formatted time remaining.
-            
-            Examples
+            Get numbers about the progress of the current encoding pass.
             
-             - 0.14, "00:15" => 14% complete, 15 seconds remaining
-             - 0.0, "Uknown" => 0% complete, uknown time remaining
+            Raises TranscoderStatusException on errors.
             
-            Raises EncoderStatusException on errors.
-            
-            @rtype: tuple
-            @return: A tuple of percent, time_rem
+            @rtype: dict
+            @return: The "percent" completed from 0.0 to 1.0, the encoded
+                     "position" in seconds, the video "fps" encoded per
+                     second of wall time, the "bytes" written so far and
+                     the "eta" in seconds; values that aren't known are None
         """
+        progress = {
+            "percent": 0.0,
+            "position": None,
+            "fps": None,
+            "bytes": None,
+            "eta": None,
+        }
+        
         duration = max(self.info.videolength, self.info.audiolength)
         
         if not duration or duration < 0:
-            return 0.0, _("Unknown")
+            return progress
         
         try:
             pos, format = self.pipe.query_position(gst.FORMAT_TIME)
@@ -747,9 +1461,19 @@ class Transcoder(gobject.GObject):
         except AttributeError:
             raise TranscoderStatusException(_("No pipeline to query!"))
         
+        progress["position"] = float(pos) / gst.SECOND
+        
+        try:
+            sink = self.pipe.get_by_name("sink")
+            progress["bytes"] = sink.query_position(gst.FORMAT_BYTES)[0]
+        except (gst.QueryError, AttributeError):
+            pass
+        
         percent = pos / float(duration)
         if percent <= 0.0:
-            return 0.0, _("Unknown")
+            return progress
+        
+        progress["percent"] = percent
         
         if self._percent_cached == percent and time.time() - self._percent_cached_time > 5:
             self.pipe.post_message(gst.message_new_eos(self.pipe))
@@ -758,8 +1482,41 @@ class Transcoder(gobject.GObject):
             self._percent_cached = percent
             self._percent_cached_time = time.time()
         
-        total = 1.0 / percent * (time.time() - self.start_time)
-        rem = total - (time.time() - self.start_time)
+        elapsed = time.time() - self.start_time
+        total = 1.0 / percent * elapsed
+        progress["eta"] = total - elapsed
+        
+        if self.info.is_video and self.preset.vcodec and elapsed > 0:
+            try:
+                rate = self.vcaps[0]["framerate"]
+                progress["fps"] = progress["position"] * rate.num / \
+                                  rate.denom / elapsed
+            except (KeyError, IndexError, AttributeError, ZeroDivisionError):
+                pass
+        
+        return progress
+    
+    def get_status(self):
+        """
+            Get information about the status of the encoder, such as the
+            percent completed and nicely formatted time remaining.
+            
+            Examples
+            
+             - 0.14, "00:15" => 14% complete, 15 seconds remaining
+             - 0.0, "Uknown" => 0% complete, uknown time remaining
+            
+            Raises EncoderStatusException on errors.
+            
+            @rtype: tuple
+            @return: A tuple of percent, time_rem
+        """
+        progress = self.get_progress()
+        
+        percent, rem = progress["percent"], progress["eta"]
+        if rem is None:
+            return 0.0, _("Unknown")
+        
         min = rem / 60
         sec = rem % 60
         
@@ -775,4 +1532,5 @@ class Transcoder(gobject.GObject):
         return percent, time_rem
     
     status = property(get_status)
+    progress = property(get_progress)
     
@@ -28,13 +28,133 @@
 
 import gettext
 import logging
+import mimetypes
 import os
 import re
 import sys
+import time
 
 _ = gettext.gettext
 
-RE_ENDS_NUM = re.compile(r'^.*(?P<number>[0-9]+)$')
+RE_ENDS_NUM = re.compile(r'^.*?(?P<number>[0-9]+)$')
+
+# How often in seconds a cached directory listing is checked for changes
+PATH_CHECK_INTERVAL = 1.0
+
+# Media types that can be converted
+SUPPORTED_FORMATS = [
+    # Found in /usr/share/mime
+    "audio/ac3",
+    "audio/AMR",
+    "audio/AMR-WB",
+    "audio/annodex",
+    "audio/basic",
+    "audio/midi",
+    "audio/mp2",
+    "audio/mp4",
+    "audio/mpeg",
+    "audio/ogg",
+    "audio/prs.sid",
+    "audio/vnd.rn-realaudio",
+    "audio/x-adpcm",
+    "audio/x-aifc",
+    "audio/x-aiff",
+    "audio/x-aiffc",
+    "audio/x-ape",
+    "audio/x-flac",
+    "audio/x-flac+ogg",
+    "audio/x-gsm",
+    "audio/x-it",
+    "audio/x-m4b",
+    "audio/x-matroska",
+    "audio/x-minipsf",
+    "audio/x-mod",
+    "audio/x-mpegurl",
+    "audio/x-ms-asx",
+    "audio/x-ms-wma",
+    "audio/x-musepack",
+    "audio/x-psf",
+    "audio/x-psflib",
+    "audio/x-riff",
+    "audio/x-s3m",
+    "audio/x-scpls",
+    "audio/x-speex",
+    "audio/x-speex+ogg",
+    "audio/x-stm",
+    "audio/x-tta",
+    "audio/x-voc",
+    "audio/x-vorbis+ogg",
+    "audio/x-wav",
+    "audio/x-wavpack",
+    "audio/x-wavpack-correction",
+    "audio/x-xi",
+    "audio/x-xm",
+    "audio/x-xmf",
+    "video/3gpp",
+    "video/annodex",
+    "video/dv",
+    "video/isivideo",
+    "video/mp2t",
+    "video/mp4",
+    "video/mpeg",
+    "video/ogg",
+    "video/quicktime",
+    "video/vivo",
+    "video/vnd.rn-realvideo",
+    "video/wavelet",
+    "video/x-anim",
+    "video/x-flic",
+    "video/x-flv",
+    "video/x-matroska",
+    "video/x-mng",
+    "video/x-ms-asf",
+    "video/x-msvideo",
+    "video/x-ms-wmv",
+    "video/x-nsv",
+    "video/x-ogm+ogg",
+    "video/x-sgi-movie",
+    "video/x-theora+ogg",
+]
+
+# Supported types that only list other files
+PLAYLIST_FORMATS = [
+    "audio/x-mpegurl",
+    "audio/x-ms-asx",
+    "audio/x-scpls",
+]
+
+# Extensions of supported types that the mimetypes module may not know or
+# knows under another name
+MEDIA_EXTENSIONS = {
+    ".3gp": "video/3gpp",
+    ".ac3": "audio/ac3",
+    ".amr": "audio/AMR",
+    ".ape": "audio/x-ape",
+    ".dv": "video/dv",
+    ".flac": "audio/x-flac",
+    ".flv": "video/x-flv",
+    ".m2t": "video/mp2t",
+    ".m2ts": "video/mp2t",
+    ".m4a": "audio/mp4",
+    ".m4b": "audio/x-m4b",
+    ".m4v": "video/mp4",
+    ".mka": "audio/x-matroska",
+    ".mkv": "video/x-matroska",
+    ".mpc": "audio/x-musepack",
+    ".mts": "video/mp2t",
+    ".nsv": "video/x-nsv",
+    ".oga": "audio/ogg",
+    ".ogg": "audio/ogg",
+    ".ogm": "video/x-ogm+ogg",
+    ".ogv": "video/ogg",
+    ".spx": "audio/x-speex",
+    ".ts": "video/mp2t",
+    ".tta": "audio/x-tta",
+    ".vob": "video/mpeg",
+    ".wma": "audio/x-ms-wma",
+    ".wmv": "video/x-ms-wmv",
+    ".wv": "audio/x-wavpack",
+}
 
 def get_search_paths():
     """
@@ -56,6 +176,125 @@ def get_search_paths():
         os.path.join(os.path.join(os.path.dirname(os.path.dirname(__file__)), "share", "arista")),
     ]
 
+class PathResolver(object):
+    """
+        Answer whether paths exist from cached directory listings instead
+        of asking the filesystem every time. A listing is only checked
+        against the directory modification time once every interval
+        seconds, call refresh after writing files that are looked up
+        right away.
+    """
+    def __init__(self, interval=PATH_CHECK_INTERVAL):
+        """
+            @type interval: float
+            @param interval: Seconds a listing is used without checking
+                             the directory modification time
+        """
+        self.interval = interval
+        self.hits = 0
+        self.misses = 0
+        self._reads = 0
+        self.refresh()
+    
+    def refresh(self):
+        """
+            Forget all cached directory listings.
+        """
+        self._listings = {}
+    
+    def _list(self, directory):
+        """
+            @rtype: set
+            @return: The names in a directory or None if it can't be listed
+        """
+        now = time.time()
+        checked, mtime, names = self._listings.get(directory,
+                                                   (None, None, None))
+        if checked is not None and now - checked < self.interval:
+            return names
+        
+        self._reads += 1
+        try:
+            current = os.stat(directory).st_mtime
+        except OSError:
+            current = None
+        
+        # A directory changed within the last few seconds can change again
+        # without a new modification time, so it is always read again
+        if checked is None or current != mtime or \
+           (current is not None and now - current < 2):
+            names = None
+            if current is not None:
+                try:
+                    names = set(os.listdir(directory))
+                except OSError:
+                    pass
+        
+        self._listings[directory] = (now, current, names)
+        
+        return names
+    
+    def exists(self, path):
+        """
+            @type path: str
+            @param path: The path to check
+            @rtype: bool
+            @return: Whether the path exists
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        if not name:
+            return os.path.exists(path)
+        
+        names = self._list(directory)
+        
+        return names is not None and name in names
+    
+    def find(self, path, search_paths):
+        """
+            Find a relative path in the first search path it exists in.
+            
+            @type path: str
+            @param path: The relative path to find
+            @type search_paths: list
+            @param search_paths: The paths to search in order
+            @rtype: str
+            @return: The full path or None if it doesn't exist anywhere
+        """
+        reads = self._reads
+        found = None
+        for search in search_paths:
+            full = os.path.join(search, path)
+            if self.exists(full):
+                found = full
+                break
+        
+        if reads == self._reads:
+            self.hits += 1
+        else:
+            self.misses += 1
+        
+        return found
+
+_resolver = PathResolver()
+
+def refresh_paths():
+    """
+        Forget the cached directory listings used by get_path and
+        get_write_path, e.g. after installing new files.
+    """
+    _resolver.refresh()
+
+def get_path_stats():
+    """
+        @rtype: dict
+        @return: The number of get_path lookups answered from memory
+                 ("hits") and that had to read from disk ("misses")
+    """
+    return {
+        "hits": _resolver.hits,
+        "misses": _resolver.misses,
+    }
+
 def get_path(*parts, **kwargs):
     """
         Get a path, searching first in the current directory, then the user's
@@ -77,10 +316,11 @@ def get_path(*parts, **kwargs):
     """
     path = os.path.join(*parts)
     
-    for search in get_search_paths():
-        full = os.path.join(search, path)
-        if os.path.exists(full):
-            return full
+    # The search paths are built again every time as the current directory
+    # may have changed
+    full = _resolver.find(path, get_search_paths())
+    if full:
+        return full
     else:
         if "default" in kwargs:
             return kwargs["default"]
@@ -114,12 +354,13 @@ def get_write_path(*parts, **kwargs):
         
         # Find part of path that exists
         test = full
-        while not os.path.exists(test):
+        while not _resolver.exists(test):
             test = os.path.dirname(test)
         
         if os.access(test, os.W_OK):
             if not os.path.exists(os.path.dirname(full)):
                 os.makedirs(os.path.dirname(full))
+                _resolver.refresh()
                 
             return full
     else:
@@ -145,10 +386,49 @@ def get_friendly_time(seconds):
       "seconds": seconds,
    }
 
+def _get_default_output(filename, extension, device_name):
+    """
+        @rtype: str
+        @return: The output path to use if nothing exists there yet
+    """
+    name, ext = os.path.splitext(filename)
+    
+    # Is this a special URI? Let's just use the basename then!
+    if name.startswith("dvd://") or name.startswith("v4l://") or name.startswith("v4l2://"):
+        name = os.path.basename(name)
+    
+    if device_name:
+        name += "-" + device_name
+    
+    return name + "." + extension
+
+def _split_number(path):
+    """
+        Split an output path into the parts used to number it when the
+        path is already taken, e.g. "out/clip05.mp4" gives
+        ("out/clip", 6, 2, "mp4").
+        
+        @rtype: tuple
+        @return: The path without its trailing number and extension, the
+                 first number to try, the number of digits to pad to and
+                 the extension
+    """
+    parts = path.split(".")
+    name, ext = ".".join(parts[:-1]), parts[-1]
+    
+    result = RE_ENDS_NUM.search(name)
+    if result:
+        value = result.group("number")
+        return name[:-len(value)], int(value) + 1, len(value), ext
+    
+    return name, 1, 0, ext
+
 def generate_output_path(filename, preset, to_be_created=[],
                          device_name=""):
     """
         Generate a new output filename from an input filename and preset.
+        Use an OutputPathAllocator instead when generating paths for many
+        files at once.
         
         @type filename: str
         @param filename: The input file name
@@ -164,29 +444,160 @@ def generate_output_path(filename, preset, to_be_created=[],
         @rtype: str
         @return: A new unique generated output path
     """
-    name, ext = os.path.splitext(filename)
+    default_out = _get_default_output(filename, preset.extension, device_name)
+    taken = set(to_be_created)
     
-    # Is this a special URI? Let's just use the basename then!
-    if name.startswith("dvd://") or name.startswith("v4l://") or name.startswith("v4l2://"):
-        name = os.path.basename(name)
+    if not os.path.exists(default_out) and default_out not in taken:
+        return default_out
     
-    if device_name:
-        name += "-" + device_name
-    default_out = name + "." + preset.extension
+    name, number, width, ext = _split_number(default_out)
+    while True:
+        default_out = "%s%0*d.%s" % (name, width, number, ext)
+        if not os.path.exists(default_out) and default_out not in taken:
+            return default_out
+        
+        number += 1
+
+class OutputPathAllocator(object):
+    """
+        Generate unique output paths for a batch of input files, using the
+        same naming as generate_output_path. Each output directory is only
+        listed once and the next free number is remembered for each name,
+        so even very large batches of inputs with the same name are fast.
+        Files created by other programs after a directory has been listed
+        are not noticed.
+        
+            >>> allocator = OutputPathAllocator()
+            >>> allocator.allocate("movie.avi", preset, device_name="ipod")
+            'movie-ipod.m4v'
+            >>> allocator.allocate("movie.avi", preset, device_name="ipod")
+            'movie-ipod1.m4v'
+    """
+    def __init__(self):
+        # Directory => set of file names that exist or will be created
+        self._taken = {}
+        # (directory, name, extension) => next number to try
+        self._next = {}
     
-    while os.path.exists(default_out) or default_out in to_be_created:
-        parts = default_out.split(".")
-        name, ext = ".".join(parts[:-1]), parts[-1]
+    def _get_taken(self, directory):
+        """
+            @rtype: set
+            @return: The names in a directory that can't be used
+        """
+        if directory not in self._taken:
+            try:
+                self._taken[directory] = set(os.listdir(directory or "."))
+            except OSError:
+                self._taken[directory] = set()
         
-        result = RE_ENDS_NUM.search(name)
-        if result:
-            value = result.group("number")
-            name = name[:-len(value)]
-            number = int(value) + 1
-        else:
-            number = 1
+        return self._taken[directory]
+    
+    def reserve(self, path):
+        """
+            Mark a path as taken, e.g. because the user has chosen it as
+            output for one of the files.
             
-        default_out = "%s%d.%s" % (name, number, ext)
+            @type path: str
+            @param path: The path that must not be allocated
+        """
+        directory, base = os.path.split(path)
+        self._get_taken(directory).add(base)
     
-    return default_out
+    def allocate(self, filename, preset, device_name="", extension=None):
+        """
+            Generate a new output path and mark it as taken.
+            
+            @type filename: str
+            @param filename: The input file name
+            @type preset: arista.presets.Preset
+            @param preset: The preset being encoded
+            @type device_name: str
+            @param device_name: Device name to append to output filename
+            @type extension: str
+            @param extension: The output file extension to use instead of
+                              the preset's extension
+            @rtype: str
+            @return: A new unique generated output path
+        """
+        default_out = _get_default_output(filename,
+                                          extension or preset.extension,
+                                          device_name)
+        directory, base = os.path.split(default_out)
+        taken = self._get_taken(directory)
+        
+        if base not in taken:
+            taken.add(base)
+            return default_out
+        
+        name, number, width, ext = _split_number(base)
+        key = (directory, name, ext)
+        number = max(number, self._next.get(key, 0))
+        
+        base = "%s%0*d.%s" % (name, width, number, ext)
+        while base in taken:
+            number += 1
+            base = "%s%0*d.%s" % (name, width, number, ext)
+        
+        taken.add(base)
+        self._next[key] = number + 1
+        
+        return os.path.join(directory, base)
 
+def get_mime_type(filename):
+    """
+        Guess the media type of a file from its extension without reading
+        it.
+        
+        @type filename: str
+        @param filename: The file name
+        @rtype: str
+        @return: The media type or None if unknown
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in MEDIA_EXTENSIONS:
+        return MEDIA_EXTENSIONS[extension]
+    
+    return mimetypes.guess_type(filename, strict=False)[0]
+
+def is_media_file(filename):
+    """
+        @type filename: str
+        @param filename: The file name
+        @rtype: bool
+        @return: Whether the extension is one of a supported media type
+    """
+    mime = get_mime_type(filename)
+    
+    return mime in SUPPORTED_FORMATS and mime not in PLAYLIST_FORMATS
+
+def find_media(directory, exclude=None):
+    """
+        Walk a directory tree and yield the media files in it as they are
+        found, in sorted order. Only the extension of each file is checked,
+        so even huge trees start yielding files right away.
+        
+            >>> for path in find_media("/home/dan/Videos"):
+            ...     print path
+            /home/dan/Videos/holiday/beach.avi
+            ...
+        
+        @type directory: str
+        @param directory: The directory to walk
+        @type exclude: str
+        @param exclude: A directory that is not walked into, e.g. because
+                        outputs are written there
+        @rtype: generator
+        @return: The paths of media files
+    """
+    if exclude:
+        exclude = os.path.abspath(exclude)
+    
+    for path, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        if exclude:
+            dirnames[:] = [x for x in dirnames if \
+                           os.path.abspath(os.path.join(path, x)) != exclude]
+        
+        for filename in sorted(filenames):
+            if is_media_file(filename):
+                yield os.path.join(path, filename)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+	Benchmark Arista Output Path Generation
+	=======================================
+	Generate output paths for a large batch of inputs with the batch
+	allocator and, for a smaller batch, with generate_output_path, in a
+	temporary directory that already contains some outputs.
+
+	Usage: ./utils/benchmark_output_paths.py [-n count] [-s small_count]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from optparse import OptionParser
+
+import arista; arista.init()
+
+class Preset(object):
+	extension = "mp4"
+
+def get_inputs(directory, count):
+	"""
+		Half of the inputs share a single name, the rest are unique.
+	"""
+	inputs = []
+	for x in range(count):
+		if x % 2:
+			name = "clip"
+		else:
+			name = "movie%d" % x
+		inputs.append(os.path.join(directory, name + ".avi"))
+
+	return inputs
+
+def run(name, inputs, allocate):
+	start = time.time()
+	outputs = allocate(inputs)
+	wall = time.time() - start
+
+	if len(set(outputs)) != len(outputs):
+		print "%s: duplicate output paths!" % name
+		raise SystemExit(1)
+
+	print "%s" % name
+	print "=" * 20
+	print "Paths:          %d" % len(outputs)
+	print "Wall time:      %.3fs" % wall
+	print "Per path:       %.1fus" % (wall * 1000000 / max(len(outputs), 1))
+	print
+
+def allocate_batch(inputs):
+	allocator = arista.utils.OutputPathAllocator()
+	return [allocator.allocate(x, Preset(), device_name="computer") \
+			for x in inputs]
+
+def allocate_single(inputs):
+	outputs = []
+	for x in inputs:
+		outputs.append(arista.utils.generate_output_path(x, Preset(),
+					   to_be_created=outputs, device_name="computer"))
+	return outputs
+
+if __name__ == "__main__":
+	parser = OptionParser(usage = "%prog [options]")
+	parser.add_option("-n", "--count", dest = "count", default = 100000,
+					  type = int,
+					  help = "Number of inputs for the batch allocator [100000]")
+	parser.add_option("-s", "--small-count", dest = "small_count",
+					  default = 2000, type = int,
+					  help = "Number of inputs for generate_output_path [2000]")
+
+	options, args = parser.parse_args()
+
+	directory = tempfile.mkdtemp(prefix="arista-paths-")
+	try:
+		# Existing outputs the generated paths must not collide with
+		for x in range(100):
+			open(os.path.join(directory, "clip-computer%d.mp4" % x), "w").close()
+
+		run("Batch allocator", get_inputs(directory, options.count),
+			allocate_batch)
+		run("generate_output_path", get_inputs(directory, options.small_count),
+			allocate_single)
+	finally:
+		shutil.rmtree(directory)
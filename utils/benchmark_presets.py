@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+	Benchmark Arista Preset Loading
+	===============================
+	Measure the time from importing Arista until the first job is ready to
+	be queued, i.e. the device and preset to use have been looked up. Each
+	run happens in a fresh interpreter, once with an empty compiled preset
+	cache and once with a warm one. For comparison the time to build every
+	device, as was done on import before presets were loaded lazily, is
+	reported as well.
+
+	Usage: ./utils/benchmark_presets.py [-n runs] [-d device]
+"""
+import os
+import subprocess
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from optparse import OptionParser
+
+import arista.utils
+
+SCRIPT = """
+import sys, time
+start = time.time()
+import arista; arista.init()
+devices = arista.presets.get()
+if %(all)r:
+	devices.items()
+preset = devices[%(device)r].default_preset
+options = arista.transcoder.TranscoderOptions("in.avi", preset, "out")
+sys.stdout.write("%%f" %% (time.time() - start))
+"""
+
+def run(runs, device, cold, all):
+	cache = arista.utils.get_write_path("cache", "presets")
+	times = []
+
+	for x in range(runs):
+		if cold and os.path.exists(cache):
+			os.unlink(cache)
+
+		output = subprocess.Popen([sys.executable, "-c", SCRIPT % {
+			"device": device,
+			"all": all,
+		}], stdout=subprocess.PIPE).communicate()[0]
+		times.append(float(output))
+
+	times.sort()
+	return times[len(times) / 2]
+
+if __name__ == "__main__":
+	parser = OptionParser(usage = "%prog [options]")
+	parser.add_option("-n", "--runs", dest = "runs", default = 10, type = int,
+					  help = "Number of runs per measurement [10]")
+	parser.add_option("-d", "--device", dest = "device", default = "computer",
+					  help = "Device to look up [computer]")
+
+	options, args = parser.parse_args()
+
+	print "Import to first job (median of %d runs)" % options.runs
+	print "=" * 40
+	print "All devices, cold cache: %.1fms" % \
+		(run(options.runs, options.device, True, True) * 1000)
+	print "One device, cold cache:  %.1fms" % \
+		(run(options.runs, options.device, True, False) * 1000)
+	print "One device, warm cache:  %.1fms" % \
+		(run(options.runs, options.device, False, False) * 1000)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+	Benchmark Arista Media Discovery
+	================================
+	Discover a corpus of media files with the fast header-only probe and
+	with the full decoding probe, then report latency and CPU time of each.
+
+	Usage: ./utils/benchmark_probe.py [-c concurrency] file [file ...]
+"""
+import os
+import resource
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from optparse import OptionParser
+
+import gobject
+gobject.threads_init()
+
+import arista; arista.init()
+
+# Make sure every file is really probed
+arista.infocache.enabled = False
+
+def cpu_time():
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_utime + usage.ru_stime
+
+def run(files, concurrency, fast):
+	latencies = []
+	failed = 0
+
+	start_cpu = cpu_time()
+	start = time.time()
+	for filename, info, is_media, seconds in \
+			arista.discoverer.discover_many(files, concurrency, fast=fast):
+		latencies.append(seconds)
+		if not is_media:
+			failed += 1
+
+	wall = time.time() - start
+	cpu = cpu_time() - start_cpu
+
+	latencies.sort()
+
+	print "%s probe" % (fast and "Fast" or "Decoding")
+	print "=" * 20
+	print "Files:          %d (%d not recognized)" % (len(latencies), failed)
+	print "Wall time:      %.3fs" % wall
+	print "CPU time:       %.3fs" % cpu
+	if latencies:
+		print "Mean latency:   %.3fs" % (sum(latencies) / len(latencies))
+		print "Median latency: %.3fs" % latencies[len(latencies) / 2]
+		print "Max latency:    %.3fs" % latencies[-1]
+	print
+
+if __name__ == "__main__":
+	parser = OptionParser(usage = "%prog [options] file [file ...]")
+	parser.add_option("-c", "--concurrency", dest = "concurrency",
+					  default = 1, type = int,
+					  help = "Number of files to discover at once [1]")
+
+	options, args = parser.parse_args()
+
+	if not args:
+		parser.print_help()
+		raise SystemExit(1)
+
+	run(args, options.concurrency, False)
+	run(args, options.concurrency, True)
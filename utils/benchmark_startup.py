@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+	Benchmark Arista Command Line Startup
+	=====================================
+	Measure how long arista-transcode takes to run for each command line mode
+	and whether GStreamer gets loaded. Every run uses a fresh interpreter and
+	a temporary home directory so the user's presets are left untouched.
+
+	Usage: ./utils/benchmark_startup.py [-n runs] [file]
+
+	If a media file is given then --source-info and --explain are measured
+	as well.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modes that must not load GStreamer, with their maximum time in seconds
+TARGETS = {
+	"--info": 0.1,
+}
+
+# Print whether gst was imported once arista-transcode exits
+WRAPPER = """
+import atexit, sys
+def report():
+	sys.stderr.write("gst-loaded: %s\\n" % ("gst" in sys.modules))
+atexit.register(report)
+sys.argv = sys.argv[1:]
+execfile(sys.argv[0], {"__name__": "__main__"})
+"""
+
+def run(args, runs, home):
+	times = []
+	loaded = False
+	env = dict(os.environ)
+	env["HOME"] = home
+
+	for x in range(runs):
+		start = time.time()
+		proc = subprocess.Popen([sys.executable, "-c", WRAPPER,
+								 os.path.join(ROOT, "arista-transcode")] + args,
+								cwd=ROOT, env=env, stdout=subprocess.PIPE,
+								stderr=subprocess.PIPE)
+		output, errors = proc.communicate()
+		times.append(time.time() - start)
+		loaded = "gst-loaded: True" in errors
+
+	times.sort()
+	return times[len(times) / 2], loaded
+
+if __name__ == "__main__":
+	parser = OptionParser(usage = "%prog [options] [file]")
+	parser.add_option("-n", "--runs", dest = "runs", default = 10, type = int,
+					  help = "Number of runs per mode [10]")
+
+	options, args = parser.parse_args()
+
+	modes = [
+		["--info"],
+		["--info", "computer"],
+		["--install-preset"],
+		["--reset-presets"],
+	]
+
+	if args:
+		modes += [
+			["--source-info", args[0]],
+			["--explain", args[0]],
+		]
+
+	home = tempfile.mkdtemp()
+	failed = False
+	try:
+		# Populate the presets and their cache once
+		run(["--info"], 1, home)
+
+		print "Startup time (median of %d runs)" % options.runs
+		print "=" * 40
+		for mode in modes:
+			seconds, loaded = run(mode, options.runs, home)
+			status = ""
+			if mode[0] in TARGETS and len(mode) == 1:
+				if seconds > TARGETS[mode[0]] or loaded:
+					status = " FAIL"
+					failed = True
+				else:
+					status = " OK"
+
+			print "%-30s %7.1fms  gst %s%s" % (" ".join(mode), seconds * 1000,
+				loaded and "loaded" or "not loaded", status)
+	finally:
+		shutil.rmtree(home)
+
+	if failed:
+		raise SystemExit(1)
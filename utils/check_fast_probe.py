@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""
+	Check the Fast Media Probe
+	==========================
+	Discover files with encoded audio (MP3, AAC, Vorbis) using the fast
+	header-only probe and make sure it finishes from the headers without
+	decoding and finds the audio rate and channels.
+
+	Usage: ./utils/check_fast_probe.py [file ...]
+
+	Without files the generated test samples are used, see
+	generate_tests.py.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import gobject
+import gst
+
+import arista; arista.init()
+
+# MP3 in AVI, AAC in MP4 and Vorbis in Ogg
+SAMPLES = ["test.avi", "test-audio.m4a", "test-audio.ogg"]
+
+def check(filename):
+	loop = gobject.MainLoop()
+
+	discoverer = arista.discoverer.Discoverer(filename, lookup = False)
+	discoverer.connect("discovered", lambda d, is_media: loop.quit())
+	discoverer.discover()
+	loop.run()
+
+	problems = []
+	if not discoverer._fast:
+		problems.append("fell back to decoding")
+	if discoverer.discovery_time >= arista.discoverer.DISCOVER_TIMEOUT:
+		problems.append("took %.3fs" % discoverer.discovery_time)
+	if not discoverer.audiorate:
+		problems.append("no audio rate")
+	if not discoverer.audiochannels:
+		problems.append("no audio channels")
+
+	discoverer.set_state(gst.STATE_NULL)
+
+	if problems:
+		print "%s: FAILED (%s)" % (filename, ", ".join(problems))
+	else:
+		print "%s: OK (%d Hz, %d channels, %.3fs)" % (filename,
+			discoverer.audiorate, discoverer.audiochannels,
+			discoverer.discovery_time)
+
+	return not problems
+
+if __name__ == "__main__":
+	files = sys.argv[1:]
+	if not files:
+		if not os.path.exists("tests"):
+			os.system("./utils/generate_tests.py")
+		files = [os.path.join("tests", x) for x in SAMPLES]
+
+	failed = [x for x in files if not check(x)]
+	if failed:
+		raise SystemExit(1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+	Arista Preset Repository Server
+	===============================
+	A small stand-in for the online preset repository, useful for testing
+	preset updates. Serves every name.tar.bz2 archive in a directory and a
+	manifest.json of their versions over HTTP/1.1 with keep-alive, ETag and
+	If-Modified-Since support.
+
+	Usage: ./utils/preset_server.py [-p port] directory
+
+	Then update against it with:
+
+		./arista-transcode --update-presets --update-location http://localhost:8000/
+"""
+import BaseHTTPServer
+import email.utils
+import os
+import tarfile
+
+try:
+	import json
+except ImportError:
+	import simplejson as json
+
+from optparse import OptionParser
+
+def get_manifest(directory):
+	"""
+		Build a dictionary of preset names to their versions from the JSON
+		file inside of each preset archive.
+	"""
+	manifest = {}
+	for filename in os.listdir(directory):
+		if not filename.endswith(".tar.bz2"):
+			continue
+
+		name = filename[:-8]
+		tar = tarfile.open(os.path.join(directory, filename), "r:bz2")
+		try:
+			member = tar.getmember(name + ".json")
+			data = json.loads(tar.extractfile(member).read())
+			manifest[name] = data.get("version", "")
+		except KeyError:
+			pass
+		tar.close()
+
+	return manifest
+
+class PresetHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		directory = self.server.directory
+		name = os.path.basename(self.path)
+
+		if name == "manifest.json":
+			body = json.dumps(get_manifest(directory), indent=4)
+			mtime = os.stat(directory).st_mtime
+			for filename in os.listdir(directory):
+				mtime = max(mtime, os.stat(os.path.join(directory, filename)).st_mtime)
+		elif name.endswith(".tar.bz2") and \
+			 os.path.exists(os.path.join(directory, name)):
+			path = os.path.join(directory, name)
+			body = open(path, "rb").read()
+			mtime = os.stat(path).st_mtime
+		else:
+			self.send_response(404)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
+		etag = '"%x-%x"' % (int(mtime), len(body))
+		modified = email.utils.formatdate(mtime, usegmt=True)
+
+		since = self.headers.get("If-Modified-Since")
+		if self.headers.get("If-None-Match") == etag or \
+		   (since and email.utils.mktime_tz(email.utils.parsedate_tz(since)) >= int(mtime)):
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
+		self.send_response(200)
+		self.send_header("Content-Type", "application/octet-stream")
+		self.send_header("Content-Length", str(len(body)))
+		self.send_header("ETag", etag)
+		self.send_header("Last-Modified", modified)
+		self.end_headers()
+		self.wfile.write(body)
+
+if __name__ == "__main__":
+	parser = OptionParser(usage = "%prog [options] directory")
+	parser.add_option("-p", "--port", dest = "port", default = 8000,
+					  type = int, help = "Port to listen on [8000]")
+
+	options, args = parser.parse_args()
+
+	if len(args) != 1:
+		parser.print_help()
+		raise SystemExit(1)
+
+	server = BaseHTTPServer.HTTPServer(("localhost", options.port),
+									   PresetHandler)
+	server.directory = args[0]
+
+	print "Serving presets from %s on port %d" % (args[0], options.port)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass